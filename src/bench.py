@@ -0,0 +1,154 @@
+#! /usr/bin/python3
+#
+# bench.py -- reproducible timings of the encoder and uploader hot paths.
+#
+# Encoder: synthetic images (seeded, so every run sees the same pixels) of several
+# diameters go through the stages of encode_polar_bin(): resample, dither, pack.
+# Reported in ms per frame, the best of --repeat runs. setup is the first call of
+# get_sampler() for a diameter, it builds the sampling tables.
+#
+# Uploader: holo_upload.Upload of --upload-mb MB to a device_sim.DeviceSim on localhost,
+# without bandwidth limit, so the numbers are our own cost: ms per MB of wall and cpu time.
+#
+# Every result is a time, lower is better. With -o the results go to a JSON file,
+# --compare checks them against such a file and fails if a stage got slower by more
+# than --threshold.
+#
+# Usage:
+#  $0 [-d 180,360,720] [-n 1,10] [-r 3] [--upload-mb 8] [-o bench.json] [--compare baseline.json] [--threshold 0.2]
+#
+# 2026-10-18, v0.1 -- initial draft.
+#
+
+import sys, json, math, time, platform, argparse
+import numpy as np
+from PIL import Image
+import encode_polar_bin as enc
+from polar_sample import get_sampler
+from dither import dither_frame
+from bit_pack import pack_frame
+from holo_upload import Upload, chunksize
+from device_sim import DeviceSim
+
+
+def test_image(diam, seed):
+  """ A color gradient with noise, the same for the same diam and seed. """
+  rnd = np.random.RandomState(seed)
+  y, x = np.mgrid[0:diam, 0:diam] * (255. / diam)
+  rgb = np.stack([x, y, 255 - (x + y) / 2], axis=-1) + rnd.normal(0, 24, (diam, diam, 3))
+  return Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8), 'RGB')
+
+
+def best_of(repeat, fn):
+  """ The shortest of repeat runs of fn() in seconds """
+  best = None
+  for i in range(repeat):
+    t0 = time.perf_counter()
+    fn()
+    t = time.perf_counter() - t0
+    best = t if best is None else min(best, t)
+  return best
+
+
+def bench_encode(diam, nframes, repeat, dither='ordered', resample='bilinear'):
+  """ Returns { stage: ms per frame } """
+  ims = [test_image(diam, seed) for seed in range(nframes)]
+  c = (diam - 1.) / 2
+  get_sampler.cache_clear()
+  res = { 'setup': 1e3 * best_of(1, lambda: get_sampler(diam, c, c, enc.n_rays, enc.leds, resample)) }
+  rgbs = [enc.polar_resample(im, diam, resample=resample) for im in ims]
+  bits = [dither_frame(rgb, dither) for rgb in rgbs]
+  stages = [
+    ('resample', lambda: [enc.polar_resample(im, diam, resample=resample) for im in ims]),
+    ('dither',   lambda: [dither_frame(rgb, dither) for rgb in rgbs]),
+    ('pack',     lambda: [pack_frame(b) for b in bits]),
+    ('encode',   lambda: [enc.encode_polar_bin(im, diam, dither=dither, resample=resample) for im in ims]),
+  ]
+  for name, fn in stages:
+    res[name] = 1e3 * best_of(repeat, fn) / nframes
+  return res
+
+
+def bench_upload(mbytes, repeat):
+  """ Returns { 'wall': ms per MB, 'cpu': ms per MB } """
+  data = np.random.RandomState(0).randint(0, 256, int(mbytes * 1e6), dtype=np.uint8).tobytes()
+  step = 64 * chunksize
+  best = {}
+  with DeviceSim(port=0, upport=0) as sim:
+    for i in range(repeat):
+      t0, c0 = time.perf_counter(), time.thread_time()     # the simulator runs in other threads
+      up = Upload(sim.address, 'bench.bin', len(data), sim.upport, max_rate=1e10)
+      buf = memoryview(data)
+      for off in range(0, len(data), step):
+        up.write(buf[off:off+step])
+      up.close()
+      res = { 'wall': time.perf_counter() - t0, 'cpu': time.thread_time() - c0 }
+      for k, v in res.items():
+        best[k] = min(best.get(k, math.inf), 1e3 * v / mbytes)
+      with sim.lock:
+        sim.files = [f for f in sim.files if f.name != 'bench.bin']     # do not keep the data
+  return best
+
+
+def run(diams, counts, repeat, upload_mb):
+  results = {}
+  for diam in diams:
+    for n in counts:
+      for stage, ms in bench_encode(diam, n, repeat).items():
+        results['encode/d%d/n%d/%s' % (diam, n, stage)] = ms
+  if upload_mb:
+    for k, ms in bench_upload(upload_mb, repeat).items():
+      results['upload/%s' % k] = ms
+  return results
+
+
+def compare(results, baseline, threshold):
+  """ Prints the table, returns the keys that got slower than baseline by more than threshold. """
+  slower = []
+  print("%-28s %10s %10s %8s" % ('', 'baseline', 'now', 'change'))
+  for key in sorted(set(results) | set(baseline)):
+    old, new = baseline.get(key), results.get(key)
+    if old is None or new is None:
+      print("%-28s %10s %10s" % (key, '-' if old is None else '%.3f' % old, '-' if new is None else '%.3f' % new))
+      continue
+    change = new / old - 1 if old else 0.
+    flag = ''
+    if change > threshold:
+      slower.append(key)
+      flag = '  SLOWER'
+    print("%-28s %10.3f %10.3f %+7.1f%%%s" % (key, old, new, 100 * change, flag))
+  return slower
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Time the encoder stages and the uploader.')
+  parser.add_argument('-d', '--diameters', default='180,360,720', help="Image diameters, comma separated. Default: 180,360,720")
+  parser.add_argument('-n', '--frames', default='1,10', help="Frame counts, comma separated. Default: 1,10")
+  parser.add_argument('-r', '--repeat', default=3, type=int, help="Runs per measurement, the best counts. Default: 3")
+  parser.add_argument('--upload-mb', default=8., type=float, help="MB per upload, 0 to skip the upload. Default: 8")
+  parser.add_argument('-o', '--output', help="Write the results as JSON to this file.")
+  parser.add_argument('--compare', metavar='BASELINE', help="JSON file from an earlier -o, exit 1 if a stage got slower.")
+  parser.add_argument('--threshold', default=0.2, type=float, help="Allowed slowdown against the baseline, 0.2 is 20%%. Default: 0.2")
+  args = parser.parse_args()
+
+  results = run([int(d) for d in args.diameters.split(',')], [int(n) for n in args.frames.split(',')],
+                args.repeat, args.upload_mb)
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump({ 'meta': { 'python': platform.python_version(), 'numpy': np.__version__,
+                            'machine': platform.machine(), 'date': time.strftime('%Y-%m-%d %H:%M:%S') },
+                  'results': results }, f, indent=1, sort_keys=True)
+  if args.compare:
+    with open(args.compare) as f:
+      slower = compare(results, json.load(f)['results'], args.threshold)
+    if slower:
+      print("%d of %d slower by more than %.0f%%: %s" % (len(slower), len(results), 100 * args.threshold, ', '.join(slower)))
+      sys.exit(1)
+  else:
+    for key in sorted(results):
+      unit = 'ms/MB' if key.startswith('upload/') else 'ms' if key.endswith('/setup') else 'ms/frame'
+      print("%-28s %10.3f %s" % (key, results[key], unit))
+
+
+if __name__ == '__main__':
+  main()
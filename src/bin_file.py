@@ -0,0 +1,357 @@
+#! /usr/bin/python3
+#
+# bin_file.py -- the .bin file format of the propeller display.
+#
+# A file starts with a 4096 byte header, followed by the frames. Each frame is
+# 2700 rays of 42 bytes (113400 bytes), followed by padding with \0 bytes.
+# See test/file_format.txt for what we found in the vendor files.
+#
+# BinWriter writes such a file, BinReader maps one into memory.
+#
+# Frame is one frame as a single uint8 array of shape (2700, 42), usually a view of
+# some other buffer. Animation is a list of frames with repeat counts, for tools that
+# build or edit a whole file in memory.
+#
+# Usage:
+#  $0 validate FILE.bin [...]
+#
+
+import os, io, sys, stat, mmap, random, argparse
+import numpy as np
+from bit_pack import pack_frame, unpack_frame
+
+header_size = 0x1000
+n_rays      = 2700
+ray_bytes   = 42              # 3 colors * 224 leds / 16
+frame_size  = n_rays * ray_bytes
+padsize     = 1288            # number of \0 bytes between frames.
+header_magic = [ 0x00, 0x00, 0x00, 0x3c, 0x18 ]      # seen with Gif-Anims
+# header_magic = [ 0x00, 0x00, 0x00, 0x01, 0x18 ]    # seen with mp4
+known_magic = { bytes([ 0x00, 0x00, 0x00, 0x3c, 0x18 ]): 'gif', bytes([ 0x00, 0x00, 0x00, 0x01, 0x18 ]): 'mp4' }
+known_padsizes = (1288, 1260) # 1260 was read from xxd dumps of vendor files.
+fps         = 200 / 21.4      # A 200 frames animation takes 21.4 seconds to play.
+iov_max     = 1024            # buffers per os.writev() call, the POSIX minimum for IOV_MAX
+
+
+def make_header():
+  """ The device does not seem to care about the rest of the header. We fill it with noise, like the vendor does. """
+  header = list(header_magic)
+  for i in range(len(header), header_size):
+    header.append(random.randint(0,255))
+  return bytes(header)
+
+
+def writev_all(fd, bufs):
+  """ os.writev() until everything is written. Short writes continue where they stopped. """
+  bufs = [memoryview(b).cast('B') for b in bufs]
+  while bufs:
+    n = os.writev(fd, bufs[:iov_max])
+    while bufs and n >= len(bufs[0]):
+      n -= len(bufs[0])
+      bufs.pop(0)
+    if n:
+      bufs[0] = bufs[0][n:]
+
+
+def frame_block(frame, padsize=padsize):
+  """ One frame and its padding as a single bytearray. """
+  frame = memoryview(frame).cast('B')
+  block = bytearray(len(frame) + padsize)
+  block[:len(frame)] = frame
+  return block
+
+
+def pwrite_all(fd, buf, offset):
+  """ os.pwrite() until everything is written. """
+  buf = memoryview(buf).cast('B')
+  while buf:
+    n = os.pwrite(fd, buf, offset)
+    buf = buf[n:]
+    offset += n
+
+
+class BinWriter:
+  """
+     Write frames to a binary file object, e.g. open(name, 'wb') or sys.stdout.buffer.
+     The header is written on construction. A frame is anything with the buffer protocol,
+     e.g. the uint8 array returned by encode_polar_bin().
+
+     Each frame is copied once into a block together with its padding. Repeats of
+     that block go out with a single os.writev() where the platform has it.
+     If nframes is known, a regular output file is preallocated to its final size.
+  """
+  def __init__(self, o, padsize=padsize, nframes=None):
+    self.o = o
+    self.padsize = padsize
+    self.frames = 0
+    self.fd = None
+    self.preallocated = False
+    header = make_header()
+    self.pos = len(header)
+    try:
+      if hasattr(os, 'writev'):
+        self.fd = o.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+      pass
+    if self.fd is None:
+      o.write(header)
+      return
+    o.flush()                   # from now on we bypass the python buffer
+    if nframes and stat.S_ISREG(os.fstat(self.fd).st_mode) and hasattr(os, 'posix_fallocate'):
+      try:
+        self.pos += os.lseek(self.fd, 0, os.SEEK_CUR)
+        os.posix_fallocate(self.fd, self.pos - len(header), len(header) + nframes * (frame_size + padsize))
+        self.preallocated = True
+      except OSError:
+        pass
+    writev_all(self.fd, [header])
+
+  def write_frame(self, frame, repeat=1):
+    block = frame_block(frame, self.padsize)
+    if self.fd is None:
+      self.o.writelines([block] * repeat)
+    else:
+      writev_all(self.fd, [block] * repeat)
+    self.pos += len(block) * repeat
+    self.frames += repeat
+
+  def close(self):
+    if self.preallocated:
+      os.ftruncate(self.fd, self.pos)     # in case we got fewer frames than announced
+    self.o.flush()
+    self.o.close()
+
+
+class Frame(np.ndarray):
+  """
+     One frame, n_rays rows of ray_bytes bytes in a single buffer. Frame(data) wraps
+     anything with the buffer protocol of frame_size bytes without a copy, e.g. a
+     BinReader frame or the result of pack_frame(). Frame() is a new black frame.
+     A Frame is an ndarray, so files, sockets and BinWriter take it as it is.
+
+     frame.rays is the plain (ray, byte) view, frame.bits() the (ray, ring, color)
+     bits, unpacked into a new array. Frame.from_bits() is the inverse.
+     Only a whole frame is a Frame: indexing, reshape() and arithmetic give plain
+     ndarrays. An ndarray must be uint8 already, it is not cast.
+  """
+  __slots__ = ()
+
+  def __new__(cls, data=None):
+    if data is None:
+      a = np.zeros(frame_size, dtype=np.uint8)
+    elif isinstance(data, np.ndarray):
+      if data.dtype != np.uint8:
+        raise ValueError("a frame is uint8, not %s" % data.dtype)
+      a = np.ascontiguousarray(data).reshape(-1)
+    else:
+      a = np.frombuffer(data, dtype=np.uint8)
+    if a.size != frame_size:
+      raise ValueError("a frame has %d bytes, not %d" % (frame_size, a.size))
+    return a.reshape(n_rays, ray_bytes).view(cls)
+
+  def __array_wrap__(self, arr, context=None, return_scalar=False):
+    arr = arr.view(np.ndarray)                # ufunc and reduction results
+    return arr[()] if return_scalar else arr
+
+  def __getitem__(self, key):
+    return self.rays[key]
+
+  def reshape(self, *shape, **kwargs):
+    return self.rays.reshape(*shape, **kwargs)
+
+  def ravel(self, order='C'):
+    return self.rays.ravel(order)
+
+  @property
+  def rays(self):
+    return self.view(np.ndarray)
+
+  def bits(self, leds=224):
+    return unpack_frame(self, leds)
+
+  @classmethod
+  def from_bits(cls, bits):
+    """ bits of shape (n_rays, leds//2, 3), nonzero is a lit LED """
+    return cls(pack_frame(bits))
+
+
+class Animation:
+  """
+     frames is a list of (Frame, repeat). write() saves them as a .bin file with
+     header and padding, Animation.read() loads one: all frames in one array, runs
+     of equal frames become repeats. len() and iteration count each repeat.
+  """
+  __slots__ = ('frames', 'padsize')
+
+  def __init__(self, frames=(), padsize=padsize):
+    self.frames = []
+    self.padsize = padsize
+    for f in frames:
+      self.append(f)
+
+  def append(self, frame, repeat=1):
+    self.frames.append((frame if isinstance(frame, Frame) else Frame(frame), repeat))
+
+  def __len__(self):
+    return sum(r for f, r in self.frames)
+
+  def __iter__(self):
+    for f, r in self.frames:
+      for i in range(r):
+        yield f
+
+  def duration(self):
+    """ playback time in seconds """
+    return len(self) / fps
+
+  def write(self, o):
+    """ o is a file name or a binary file object, which is closed when done. """
+    if isinstance(o, str):
+      o = open(o, 'wb')
+    w = BinWriter(o, self.padsize, len(self))
+    for f, r in self.frames:
+      w.write_frame(f, r)
+    w.close()
+
+  @classmethod
+  def read(cls, path):
+    with BinReader(path) as r:
+      data = np.empty((len(r), frame_size), dtype=np.uint8)
+      for i in range(len(r)):
+        data[i] = np.frombuffer(r[i], dtype=np.uint8)
+      anim = cls(padsize=r.padsize or padsize)
+    for i in range(len(data)):
+      if i and np.array_equal(data[i], data[i-1]):
+        anim.frames[-1] = (anim.frames[-1][0], anim.frames[-1][1] + 1)
+      else:
+        anim.frames.append((Frame(data[i]), 1))
+    return anim
+
+
+class BinReader:
+  """
+     Memory mapped access to a .bin file.
+     reader[i] is a zero-copy memoryview of frame i, frame_size bytes.
+     Release all memoryviews before calling close().
+
+     The frame offsets are indexed on open. Normally frames are a fixed stride
+     apart and only the padding is checked. Otherwise we walk the file from frame
+     to frame and take the first nonzero byte after the padding as the next start.
+     Everything unexpected is collected in self.anomalies.
+  """
+  def __init__(self, path):
+    self.path = path
+    self.anomalies = []
+    self.f = open(path, 'rb')
+    self.size = os.fstat(self.f.fileno()).st_size
+    if self.size < header_size:
+      raise ValueError("%s: %d bytes, too short for the %d byte header" % (path, self.size, header_size))
+    self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+    self.a = np.frombuffer(self.mm, dtype=np.uint8)
+    self.header = memoryview(self.mm)[:header_size]
+    self.magic = known_magic.get(bytes(self.header[:5]))
+    if self.magic is None:
+      self.anomalies.append("unknown header magic %s" % bytes(self.header[:5]).hex())
+    self.padsize = None
+    self.offsets = self.index_regular()
+    if self.offsets is None:
+      self.offsets = self.index_scan()
+
+  def index_regular(self):
+    body = self.size - header_size
+    for pad in known_padsizes:
+      stride = frame_size + pad
+      n, rest = divmod(body, stride)
+      if rest == frame_size:              # last frame without padding
+        n += 1
+      elif rest:
+        continue
+      self.padsize = pad
+      offsets = header_size + stride * np.arange(n)
+      # the padding of all frames as one strided view, without touching the frame data.
+      full = n if rest == 0 else n-1
+      pads = np.lib.stride_tricks.as_strided(self.a[header_size+frame_size:], shape=(full, pad), strides=(stride, 1))
+      for i in np.flatnonzero(pads.any(axis=1)):
+        self.anomalies.append("frame %d: nonzero bytes in padding at 0x%x" % (i, offsets[i] + frame_size))
+      return offsets
+    return None
+
+  def index_scan(self):
+    offsets = []
+    pos = header_size
+    maxpad = max(known_padsizes)
+    while pos + frame_size <= self.size:
+      offsets.append(pos)
+      end = pos + frame_size
+      if end == self.size:
+        break
+      nz = np.flatnonzero(self.a[end:end+maxpad+1])
+      gap = int(nz[0]) if len(nz) else None
+      if gap in known_padsizes:
+        pos = end + gap
+        continue
+      if gap is not None and gap < maxpad:
+        self.anomalies.append("frame %d: nonzero bytes in padding at 0x%x" % (len(offsets)-1, end + gap))
+      elif self.size - end >= padsize + frame_size:
+        self.anomalies.append("frame %d: next frame starts with zeros, assuming padding %d" % (len(offsets), padsize))
+      pos = end + padsize
+    tail = self.size - (offsets[-1] + frame_size if offsets else header_size)
+    if tail and not offsets:
+      self.anomalies.append("%d bytes after the header, less than one frame" % tail)
+    elif tail > maxpad:
+      self.anomalies.append("%d trailing bytes after the last frame" % tail)
+    return np.array(offsets, dtype=np.int64)
+
+  def __len__(self):
+    return len(self.offsets)
+
+  def __getitem__(self, i):
+    off = int(self.offsets[i])
+    return memoryview(self.mm)[off:off+frame_size]
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self[i]
+
+  def duration(self):
+    """ playback time in seconds """
+    return len(self) / fps
+
+  def close(self):
+    self.header.release()
+    del self.a
+    self.mm.close()
+    self.f.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def validate(path, verbose=False):
+  """ Print a short report, return the number of anomalies. """
+  with BinReader(path) as r:
+    print("%s: %d bytes, %s header, %d frames, padding %s, %.1f sec" % (
+      path, r.size, r.magic or 'unknown', len(r), r.padsize or 'irregular', r.duration()))
+    if verbose:
+      for i, off in enumerate(r.offsets):
+        print("  frame %4d at 0x%08x" % (i, off))
+    for a in r.anomalies:
+      print("  " + a)
+    return len(r.anomalies)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Inspect .bin files of the 224 LED holographic propeller display.')
+  parser.add_argument('-v', '--verbose', action='store_true', help="List the offset of each frame.")
+  parser.add_argument('cmd', metavar='COMMAND', choices=['validate'], help="validate: report frame count, duration and layout anomalies.")
+  parser.add_argument('files', metavar='FILE', nargs='+', help=".bin files")
+  args = parser.parse_args()
+
+  bad = 0
+  for f in args.files:
+    if validate(f, args.verbose):
+      bad += 1
+  sys.exit(1 if bad else 0)
@@ -0,0 +1,94 @@
+#! /usr/bin/python3
+#
+# bin_preview.py -- render a .bin file as it would look on the propeller.
+#
+# Each frame is unpacked into (ray, led, color) bits, the inverse of rgb_bit_columns().
+# The dither is averaged over a window of consecutive rays, like the eye does while
+# the propeller spins. Then every pixel of the output image looks up its nearest
+# (ray, led) sample through a precomputed inverse map.
+#
+# Works for our own output and for the vendor files in test/bin.
+#
+# Usage:
+#  $0 [-s 360] [-w 12] [-f N] FILE.bin [-o preview.gif]
+#
+# A single frame (-f N, or a one frame file) is written as PNG, otherwise an animated GIF.
+#
+
+import sys, math, argparse, functools
+import numpy as np
+from PIL import Image
+from bin_file import BinReader, Frame, fps
+
+n_rays = 2700
+leds = 224
+
+
+@functools.lru_cache(maxsize=4)
+def inverse_map(size, n_rays=n_rays, leds=leds):
+  """
+     For each pixel of a size x size image the flat index into (n_rays, leds//2),
+     or -1 outside the disc. Same geometry as encode_polar_bin() with diam=size.
+  """
+  c = (size-1.)/2
+  sca = float(size-1)/float(leds-1)
+  y, x = np.mgrid[0:size, 0:size]
+  dx = x - c
+  dy = y - c
+  r = np.hypot(dx, dy)
+  phi = np.arctan2(dy, dx) % (2*math.pi)
+  # encode_polar_bin(): phi = radians(360.*(n_rays-n)/n_rays)
+  ray = np.rint(n_rays - phi * n_rays / (2*math.pi)).astype(np.intp) % n_rays
+  led = np.rint(r / sca - 0.5).astype(np.intp)
+  idx = ray * (leds//2) + led
+  idx[(led < 0) | (led >= leds//2)] = -1
+  return idx
+
+
+def ray_average(bits, window=12):
+  """ Mean of each LED over window consecutive rays (circular), values 0..255 """
+  if window <= 1:
+    return bits * np.uint8(255)
+  v = bits.astype(np.uint16)
+  cs = np.cumsum(np.concatenate([v[-window:], v]), axis=0)
+  avg = (cs[window:] - cs[:-window]) * (255. / window)
+  return np.roll(avg, -(window//2), axis=0).astype(np.uint8)
+
+
+def render_frame(frame, size=360, window=12):
+  """ frame is 113400 bytes (anything with the buffer protocol). Returns a PIL RGB image. """
+  rgb = ray_average(Frame(frame).bits(leds), window)
+  idx = inverse_map(size)
+  flat = np.concatenate([rgb.reshape(-1, 3), np.zeros((1, 3), dtype=np.uint8)])   # index -1 is black
+  return Image.fromarray(flat[idx], 'RGB')
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Render a .bin file for the 224 LED holographic propeller display into a PNG or GIF preview.')
+  parser.add_argument('-o', '--output', help="Output file. Default: FILE.gif or FILE.png")
+  parser.add_argument('-s', '--size', default=360, type=int, help="Image width and height. Default: 360")
+  parser.add_argument('-w', '--window', default=12, type=int, help="Number of rays to average the dither over. Default: 12")
+  parser.add_argument('-f', '--frame', type=int, help="Render only this frame.")
+  parser.add_argument('file', metavar='FILE.bin')
+  args = parser.parse_args()
+
+  r = BinReader(args.file)
+  for a in r.anomalies:
+    print("%s: %s" % (args.file, a), file=sys.stderr)
+  if args.frame is not None:
+    images = [render_frame(r[args.frame], args.size, args.window)]
+  else:
+    images = [render_frame(f, args.size, args.window) for f in r]
+  r.close()
+  if not images:
+    print("%s: no frames" % args.file, file=sys.stderr)
+    sys.exit(1)
+
+  out = args.output
+  if out is None:
+    out = args.file.rsplit('.', 1)[0] + ('.png' if len(images) == 1 else '.gif')
+  if len(images) == 1:
+    images[0].save(out)
+  else:
+    images[0].save(out, save_all=True, append_images=images[1:], duration=int(1000./fps), loop=0)
+  print("%s: %d frames written to %s" % (args.file, len(images), out))
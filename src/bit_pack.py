@@ -0,0 +1,68 @@
+#! /usr/bin/python3
+#
+# bit_pack.py -- table driven packing of dithered bits into the .bin row layout.
+#
+# Each ray is stored as 42 bytes. Every group of 3 bytes carries 8 rings with
+# 3 colors each, interleaved as described in the README. rgb_bit_columns() knows
+# where a (led, color) pair goes. We turn that into a permutation table once and
+# then pack a whole frame with one fancy index and one np.packbits().
+#
+
+import functools
+import numpy as np
+
+
+def rgb_bit_columns(x, width):
+  #            0   1   2   3   4   5   6   7
+  #           ---+---+---+---+---+---+---+---
+  zigzag_r = [ 16, 19, 22, 9,  12, 15, 2,  5 ]
+  zigzag_g = [ 17, 20, 23, 10, 13, 0,  3,  6 ]
+  zigzag_b = [ 18, 21, 8,  11, 14, 1,  4,  7 ]
+  o = width - 24 - x // 8 * 8 * 3
+  m = x % 8
+  return (o + zigzag_r[m], o + zigzag_g[m], o + zigzag_b[m])
+
+
+@functools.lru_cache(maxsize=4)
+def column_table(leds):
+  """
+     Column number for each (led, color), shape (leds//2, 3).
+     Column c ends up in byte c//8 with bit value 1 << (c%8).
+  """
+  width = leds // 2 * 3
+  return np.array([rgb_bit_columns(led, width) for led in range(leds//2)], dtype=np.intp)
+
+
+@functools.lru_cache(maxsize=4)
+def pack_table(leds):
+  """
+     Inverse of column_table(): for each column the index into the flattened
+     (led, color) axis.
+  """
+  cols = column_table(leds).ravel()
+  perm = np.empty_like(cols)
+  perm[cols] = np.arange(len(cols))
+  return perm
+
+
+def pack_frame(bits):
+  """
+     bits is an array of shape (n_rays, leds//2, 3), any nonzero value is a lit LED.
+     Returns the frame as uint8 array of shape (n_rays, 3*leds//16).
+  """
+  n_rays, half, ncol = bits.shape
+  cols = np.ascontiguousarray(bits.reshape(n_rays, half*ncol)[:, pack_table(half*2)])
+  # rows are a multiple of 8 bits, so packing the flat array keeps the row boundaries.
+  return np.packbits(cols.ravel(), bitorder='little').reshape(n_rays, half*ncol//8)
+
+
+def unpack_frame(data, leds=224):
+  """
+     Inverse of pack_frame(). data is anything with the buffer protocol holding whole rows,
+     e.g. a frame as read from a .bin file. Returns uint8 bits of shape (n_rays, leds//2, 3).
+  """
+  row = 3*leds//16
+  a = np.frombuffer(data, dtype=np.uint8)
+  a = a[:len(a)//row*row].reshape(-1, row)
+  cols = np.unpackbits(a, axis=1, bitorder='little')
+  return cols[:, column_table(leds)]
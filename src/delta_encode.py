@@ -0,0 +1,56 @@
+#! /usr/bin/python3
+#
+# delta_encode.py -- encode animations by updating only what changed.
+#
+# Many clips change only a small area from one frame to the next. DeltaEncoder keeps
+# the previous source frame, its dither bits and its packed frame. For a new frame it
+# compares the pixels, looks up the affected (ray, led) samples in the inverse index of
+# the sampler, resamples and dithers only those, and repacks only the rays they are on.
+# The result is byte for byte the same as a full encode_polar_bin().
+#
+# Only for ordered dither: with error diffusion every sample depends on all rays before it.
+#
+
+import numpy as np
+from polar_sample import get_sampler
+from dither import ordered_dither, ordered_dither_samples
+from bit_pack import pack_frame
+from bin_file import Frame
+
+
+class DeltaEncoder:
+  def __init__(self, n_rays=2700, leds=224, resample='bilinear'):
+    self.n_rays = n_rays
+    self.leds = leds
+    self.resample = resample
+    self.prev = None
+    self.frames = 0
+    self.full = 0
+    self.samples = 0          # number of samples recomputed in delta frames
+
+  def encode(self, im):
+    """ im is a PIL RGB image. Returns the packed bin_file.Frame. """
+    pix = np.asarray(im)
+    diam = min(pix.shape[0], pix.shape[1])
+    sampler = get_sampler(diam, (diam-1.)/2, (diam-1.)/2, self.n_rays, self.leds, self.resample)
+    self.frames += 1
+    if self.prev is None or pix.shape != self.prev.shape:
+      self.full += 1
+      self.bits = ordered_dither(sampler.resample(pix))
+      self.packed = pack_frame(self.bits)
+    else:
+      ys, xs = np.nonzero(np.any(pix != self.prev, axis=2))
+      samples = sampler.inverse.samples(ys, xs)
+      if len(samples):
+        self.samples += len(samples)
+        vals = sampler.resample_samples(pix, samples)
+        self.bits.reshape(-1, 3)[samples] = ordered_dither_samples(vals, samples, self.n_rays, self.leds)
+        rays = np.unique(samples // (self.leds//2))
+        self.packed[rays] = pack_frame(self.bits[rays])
+    self.prev = pix
+    return Frame(self.packed.copy())
+
+  def stats(self):
+    delta = self.frames - self.full
+    return "delta: %d frames, %d full, %.1f%% of the samples recomputed in the others" % (
+      self.frames, self.full, 100. * self.samples / max(1, delta * self.n_rays * (self.leds//2)))
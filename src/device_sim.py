@@ -0,0 +1,279 @@
+#! /usr/bin/python3
+#
+# device_sim.py -- a local stand-in for the propeller display, for testing without the device.
+#
+# Speaks the two protocols as seen in doc/upload-protocol.txt and doc/wireshark:
+#
+#  Control port 5233:
+#   c0eeb7c9baa3020000000014cc + 34|35|38 + lfh + bfb5d2a2      pause, play, status
+#   c0eeb7c9baa3020000000014cc + 39 + lfj + NN + bfb5d2a2       delete NN
+#   Every command is answered with the listing:
+#   c0eeb7c9baa3020000000012cc38lnt + {LLNNname.bin} + CCHE1P + bfb5d2a2
+#   LL is len(name)+2, NN the index from 01, CC the current index, P is 1 when playing.
+#   The meaning of the three letters after 38 is unknown. The device sends lnt, lmm or lpj,
+#   we always send lnt, led-hologram.py ignores them.
+#
+#  Upload port 5499:
+#   d3e0c9ba02014dd8 0AgQ LLLL name.bin bfb5d2a2      LLLL: file size including the padding
+#   d3e0c9ba02014dd8 1GnH <1432 bytes> bfb5d2a2       one per 1460 byte packet
+#   d3e0c9ba02014dd8 1AfF bfb5d2a2                    end of file
+#   The device replies d3e0c9ba02012dd80AfJffffbfb5d2a2 to 0AgQ and
+#   d3e0c9ba02012dd81AfJffffbfb5d2a2 after every 16 data packets.
+#   The new file is listed as soon as the name arrives. After 1AfF, or when no data
+#   arrives for 18 seconds, the file is closed and played.
+#
+# Bandwidth, latency and receive buffer are configurable, so that uploads can be
+# benchmarked offline.
+#
+# Usage:
+#  $0 [-a 127.0.0.1] [-p 5233] [-u 5499] [-b KB/s] [-l SEC] [-r BYTES] [-s SEC]
+#
+#  led-hologram.py -a 127.0.0.1 upload FILE.bin
+#
+
+import sys, time, socket, argparse, threading, socketserver
+from holo_proto import CMD_HEADER, LIST_HEADER, TRAILER
+from holo_upload import PACKET_SIZE, PACKET_HEADER, PACKET_TYPE_NAME, PACKET_TYPE_DATA, PACKET_TYPE_END
+
+REPLY_HEADER     = b'd3e0c9ba02012dd8'
+
+default_files = [ '00_green_earth.bin', '01_green_earth.bin', '02_spinning_coin.bin',
+                  '03_spinning_coin.bin', '04_bouncing_fraph.bin', '05_spinning_heart.bin' ]
+
+
+class SimFile:
+  def __init__(self, name, size=0, data=None):
+    self.name = name
+    self.size = size              # announced in 0AgQ
+    self.data = data if data is not None else bytearray()
+    self.complete = data is not None
+
+
+class DeviceSim:
+  """
+     The simulated device. start() serves both ports in background threads, the
+     actual port numbers are in self.port and self.upport (pass 0 to get free ports).
+     files is the playlist, a list of SimFile. All state changes hold self.lock.
+
+     bandwidth     upload bytes per second, None for unlimited
+     latency       seconds before each reply
+     rcvbuf        SO_RCVBUF of the upload socket in bytes, None for the system default
+     stall_time    seconds without upload data, then the partial file is played
+  """
+  def __init__(self, address='127.0.0.1', port=5233, upport=5499, bandwidth=None, latency=0.,
+               rcvbuf=None, stall_time=18., ack_every=16, files=default_files, verbose=False):
+    self.address = address
+    self.port = port
+    self.upport = upport
+    self.bandwidth = bandwidth
+    self.latency = latency
+    self.rcvbuf = rcvbuf
+    self.stall_time = stall_time
+    self.ack_every = ack_every
+    self.verbose = verbose
+    self.files = [SimFile(n, 0, b'') for n in files]
+    self.current = 1 if self.files else 0
+    self.playing = True
+    self.uploads = 0
+    self.stalls = 0
+    self.lock = threading.Lock()
+    self.servers = []
+
+  def log(self, msg):
+    if self.verbose:
+      print("device_sim: " + msg)
+      sys.stdout.flush()
+
+  def listing(self):
+    with self.lock:
+      body = b''.join(b'%02d%02d%s' % (len(f.name)+2, i+1, f.name.encode('UTF-8')) for i, f in enumerate(self.files))
+      return LIST_HEADER + b'38lnt' + body + b'%02dHE1%d' % (self.current, self.playing) + TRAILER
+
+  def command(self, msg):
+    """ Handle one control message, return the reply. """
+    code = msg[len(CMD_HEADER):len(CMD_HEADER)+2]
+    with self.lock:
+      if code == b'34':
+        self.playing = False
+      elif code == b'35':
+        self.playing = True
+      elif code == b'39':
+        try:
+          idx = int(msg[len(CMD_HEADER)+5:len(CMD_HEADER)+7])
+        except ValueError:
+          idx = 0
+        if 1 <= idx <= len(self.files):
+          self.log("delete %02d %s" % (idx, self.files[idx-1].name))
+          del self.files[idx-1]
+          if self.current > idx or self.current > len(self.files):
+            self.current -= 1
+      elif code != b'38':
+        self.log("unknown command %s" % msg)
+    return self.listing()
+
+  def close_upload(self, f, why):
+    with self.lock:
+      f.complete = True
+      if f in self.files:
+        self.current = self.files.index(f) + 1
+        self.playing = True
+    self.log("%s: %d of %d bytes, %s, now playing" % (f.name, len(f.data), f.size, why))
+
+  def start(self):
+    for (port, handler) in ((self.port, ControlHandler), (self.upport, UploadHandler)):
+      srv = SimServer((self.address, port), handler, self)
+      threading.Thread(target=srv.serve_forever, daemon=True).start()
+      self.servers.append(srv)
+    self.port = self.servers[0].server_address[1]
+    self.upport = self.servers[1].server_address[1]
+    self.log("listening on %s ports %d and %d" % (self.address, self.port, self.upport))
+    return self
+
+  def stop(self):
+    for srv in self.servers:
+      srv.shutdown()
+      srv.server_close()
+    self.servers = []
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *exc):
+    self.stop()
+
+
+class SimServer(socketserver.ThreadingTCPServer):
+  allow_reuse_address = True
+  daemon_threads = True
+
+  def __init__(self, addr, handler, sim):
+    self.sim = sim
+    socketserver.ThreadingTCPServer.__init__(self, addr, handler)
+
+  def server_bind(self):
+    if self.sim.rcvbuf and self.RequestHandlerClass is UploadHandler:
+      # set before listen(), so that the window scaling of accepted sockets matches.
+      self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.sim.rcvbuf)
+    socketserver.ThreadingTCPServer.server_bind(self)
+
+
+class ControlHandler(socketserver.BaseRequestHandler):
+  def handle(self):
+    sim = self.server.sim
+    buf = b''
+    while True:
+      data = self.request.recv(1024)
+      if not data:
+        return
+      buf += data
+      while TRAILER in buf:
+        msg, buf = buf.split(TRAILER, 1)
+        time.sleep(sim.latency)
+        self.request.sendall(sim.command(msg + TRAILER))
+
+
+class UploadHandler(socketserver.BaseRequestHandler):
+  def recv(self, n):
+    """ recv() throttled to the bandwidth of the simulated link """
+    sim = self.server.sim
+    data = self.request.recv(min(n, PACKET_SIZE) if sim.bandwidth else n)
+    if sim.bandwidth and data:
+      self.t_next = max(self.t_next, time.monotonic() - 0.05) + len(data) / sim.bandwidth
+      delay = self.t_next - time.monotonic()
+      if delay > 0:
+        time.sleep(delay)
+    return data
+
+  def reply(self, ptype, code=b'ffff'):
+    time.sleep(self.server.sim.latency)
+    self.request.sendall(REPLY_HEADER + ptype + code + TRAILER)
+
+  def packet_len(self, buf):
+    """ Length of the packet at the start of buf, None if more bytes are needed to tell. """
+    if len(buf) < len(PACKET_HEADER) + 4:
+      return None
+    ptype = buf[16:20]
+    if ptype == PACKET_TYPE_NAME:
+      end = buf.find(TRAILER, 24)
+      return None if end < 0 else end + len(TRAILER)
+    if ptype == PACKET_TYPE_DATA:
+      return PACKET_SIZE
+    if ptype == PACKET_TYPE_END:
+      return len(PACKET_HEADER) + 4 + len(TRAILER)
+    return len(buf)               # garbage, let handle() complain
+
+  def handle(self):
+    sim = self.server.sim
+    self.request.settimeout(sim.stall_time)
+    self.t_next = time.monotonic()
+    f = None
+    packets = 0
+    buf = bytearray()
+    try:
+      while True:
+        n = self.packet_len(buf)
+        if n is None or len(buf) < n:
+          data = self.recv(65536)
+          if not data:
+            break
+          buf += data
+          continue
+        if buf[:16] != PACKET_HEADER:
+          sim.log("upload: bad packet header %s" % bytes(buf[:20]))
+          break
+        ptype = bytes(buf[16:20])
+        if ptype == PACKET_TYPE_NAME:
+          f = SimFile(buf[24:n-len(TRAILER)].decode('UTF-8', 'replace'), int.from_bytes(buf[20:24], 'big'))
+          del buf[:n]
+          with sim.lock:
+            sim.files.append(f)
+            sim.uploads += 1
+          sim.log("upload %s, %d bytes" % (f.name, f.size))
+          self.reply(b'0AfJ')
+        elif ptype == PACKET_TYPE_DATA and f:
+          if buf[PACKET_SIZE-len(TRAILER):PACKET_SIZE] != TRAILER:
+            sim.log("upload: data packet %d without trailer" % packets)
+            break
+          f.data += buf[20:PACKET_SIZE-len(TRAILER)]
+          del buf[:n]
+          packets += 1
+          if packets % sim.ack_every == 0:
+            self.reply(b'1AfJ')
+        elif ptype == PACKET_TYPE_END and f and buf[20:n] == TRAILER:
+          del buf[:n]
+          sim.close_upload(f, "complete" if len(f.data) == f.size else "size mismatch")
+          f = None
+        else:
+          sim.log("upload: unexpected packet %s" % bytes(buf[:28]))
+          break
+    except socket.timeout:
+      if f:
+        with sim.lock:
+          sim.stalls += 1
+        sim.close_upload(f, "stalled for %.1f sec" % sim.stall_time)
+        f = None
+    except OSError:
+      pass
+    if f:
+      sim.close_upload(f, "connection closed")
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Simulate a 224 LED holographic propeller display on the local host.')
+  parser.add_argument('-a', '--address', default='127.0.0.1', help="Address to listen on. Default: 127.0.0.1")
+  parser.add_argument('-p', '--port', default=5233, type=int, help="Control port. Default: 5233")
+  parser.add_argument('-u', '--upload-port', default=5499, type=int, help="Upload port. Default: 5499")
+  parser.add_argument('-b', '--bandwidth', type=float, help="Upload bandwidth in KB/s. Default: unlimited")
+  parser.add_argument('-l', '--latency', default=0., type=float, help="Delay before each reply in seconds. Default: 0")
+  parser.add_argument('-r', '--rcvbuf', type=int, help="Receive buffer of the upload socket in bytes. Default: system default")
+  parser.add_argument('-s', '--stall', default=18., type=float, help="Seconds without upload data before the partial file is played. Default: 18")
+  args = parser.parse_args()
+
+  sim = DeviceSim(args.address, args.port, args.upload_port, args.bandwidth and args.bandwidth*1e3,
+                  args.latency, args.rcvbuf, args.stall, verbose=True)
+  sim.start()
+  try:
+    while True:
+      time.sleep(3600)
+  except KeyboardInterrupt:
+    sim.stop()
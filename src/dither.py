@@ -0,0 +1,126 @@
+#! /usr/bin/python3
+#
+# dither.py -- whole frame dithering for the polar encoder.
+#
+# Input is the resampled frame as an array of shape (n_rays, leds//2, 3) with values
+# in 0..255, output is an array of the same shape with 0 or 1 per LED, ready for
+# bit_pack.pack_frame().
+#
+# Backends:
+#  ordered      The 2 column x 12 ray pattern of ordered_dith(). The pattern is turned
+#               into a lookup table indexed by (phase, value), the phase of each sample
+#               is precomputed, then a frame is one fancy index.
+#  diffusion    One-dimensional error diffusion, see error_diffusion.py. The error is
+#               carried from ray to ray, i.e. in the direction of rotation, for each
+#               of the 336 bit columns. All columns are processed together.
+#
+# Run this file to print the throughput of each backend in frames per second.
+#
+
+import functools
+import numpy as np
+from bit_pack import column_table
+
+dith = (
+  ( 0, 0, 0, 0, 0, 0,  0, 0, 0, 0, 0, 0 ),
+  ( 0, 0, 0, 0, 0, 0,  0, 0, 0, 0, 0, 0 ),
+  ( 1, 0, 0, 0, 0, 0,  0, 0, 0, 0, 0, 0 ),
+  ( 1, 0, 0, 0, 0, 0,  1, 0, 0, 0, 0, 0 ),
+  ( 1, 1, 0, 0, 0, 0,  1, 0, 0, 0, 0, 0 ),
+  ( 1, 1, 0, 0, 0, 0,  1, 1, 0, 0, 0, 0 ),
+  ( 1, 1, 1, 0, 0, 0,  1, 1, 0, 0, 0, 0 ),
+  ( 1, 1, 1, 0, 0, 0,  1, 1, 1, 0, 0, 0 ),
+  ( 1, 1, 1, 1, 0, 0,  1, 1, 1, 0, 0, 0 ),
+  ( 1, 1, 1, 1, 0, 0,  1, 1, 1, 1, 0, 0 ),
+  ( 1, 1, 1, 1, 1, 0,  1, 1, 1, 1, 0, 0 ),
+  ( 1, 1, 1, 1, 1, 0,  1, 1, 1, 1, 1, 0 ),
+  ( 1, 1, 1, 1, 1, 1,  1, 1, 1, 1, 1, 0 ),
+  ( 1, 1, 1, 1, 1, 1,  1, 1, 1, 1, 1, 1 ),
+  ( 1, 1, 1, 1, 1, 1,  1, 1, 1, 1, 1, 1 )
+)
+
+
+def ordered_dith(x, y, val):
+  """ val is expected in 0...255
+      x is used modulo 2
+      y is used modulo 12
+
+      The dither pattern has 13 different values. We duplicate the first and the last value to
+      stretch the typical video range of [16..240] back into [0..255]
+  """
+  val = max(0, min(255, int(val)))      # clamp and
+  v14 = int(val / 17.01)                # squeeze into [0..14]
+  d = dith[v14]
+  y += 6 * (int(x) % 2)
+  return d[int(y) % 12]
+
+
+@functools.lru_cache(maxsize=1)
+def ordered_lut():
+  """
+     lut[phase, val] == ordered_dith(x, y, val) with phase = (y + 6*(x%2)) % 12
+  """
+  return np.array([[ordered_dith(0, phase, val) for val in range(256)] for phase in range(12)],
+                  dtype=np.uint8)
+
+
+@functools.lru_cache(maxsize=4)
+def ordered_phase(n_rays, leds):
+  """ Dither phase of each sample, shape (n_rays, leds//2, 3). """
+  col_odd = column_table(leds) % 2
+  ray = np.arange(n_rays)[:, np.newaxis, np.newaxis]
+  return ((ray + 6 * col_odd[np.newaxis,:,:]) % 12).astype(np.uint8)
+
+
+def ordered_dither(rgb):
+  """ Same bits as calling ordered_dith(column, ray, val) for each sample. """
+  n_rays, half, ncol = rgb.shape
+  return ordered_lut()[ordered_phase(n_rays, half*2), rgb]
+
+
+def ordered_dither_samples(vals, samples, n_rays, leds):
+  """
+     vals has shape (len(samples), 3) for the flat sample indices (ray * leds//2 + led).
+     Same bits as ordered_dither(rgb).reshape(-1, 3)[samples].
+  """
+  return ordered_lut()[ordered_phase(n_rays, leds).reshape(-1, 3)[samples], vals]
+
+
+def diffusion_dither(rgb, med=127):
+  """
+     Carry the error of each LED on to the same LED in the next ray.
+     The first ray starts without error.
+  """
+  n_rays = rgb.shape[0]
+  vals = rgb.reshape(n_rays, -1).astype(np.int16)
+  out = np.empty(vals.shape, dtype=np.uint8)
+  err = np.zeros(vals.shape[1], dtype=np.int16)
+  for n in range(n_rays):
+    v = err + vals[n]
+    on = v > med
+    out[n] = on
+    err = v - 255 * on
+  return out.reshape(rgb.shape)
+
+
+backends = {
+  'ordered':   ordered_dither,
+  'diffusion': diffusion_dither,
+}
+
+def dither_frame(rgb, mode='ordered'):
+  """ rgb must be uint8, as returned by PolarSampler.resample(). """
+  return backends[mode](rgb)
+
+
+if __name__ == '__main__':
+  import time
+  rgb = np.random.RandomState(1).randint(0, 256, (2700, 112, 3)).astype(np.uint8)
+  for mode in backends:
+    dither_frame(rgb, mode)           # warm up the lookup tables
+    n = 0
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < 1.0:
+      dither_frame(rgb, mode)
+      n += 1
+    print("%-10s %8.1f fps" % (mode, n / (time.perf_counter() - t0)))
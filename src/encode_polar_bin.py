@@ -2,28 +2,55 @@
 #
 # encode_polar_bin.py -- fun with polar coordinates.
 #
-# rgb_bit_columns() implements the pattern described in the README.
+# rgb_bit_columns() in bit_pack.py implements the pattern described in the README.
 # It seems correct!
 #
 # Usage:
-#  env HOLO_REP_IMG=1 $0 image1.jpg [image2.jpg ...]
+#  env HOLO_REP_IMG=1 $0 [-o out.bin] [--dither ordered|diffusion] [--resample bilinear|area] [--jobs N] [--cache DIR] [--delta] [--update] [--upload ADDRESS] [--profile] [--profile-out trace.json] image1.jpg [image2.jpg ...]
 #
-# output file: rgb_enc_01.bin
+# default output file: rgb_enc_01.bin, use -o - to write to stdout.
+# An animated GIF, APNG or video (via ffmpeg) in the image list adds all its frames, timed
+# like the original. HOLO_REP_IMG only applies to still images.
+# With --upload the output goes straight to the device under that name, no file is written.
 #
 # 2020-03-20, jw v0.4 -- using ordered dither instead of error diffusion to reduce color noise.
+# 2026-10-18,    v0.5 -- sampling via precomputed PolarSampler tables, see polar_sample.py
+#                        table driven bit packing, see bit_pack.py
+#                        whole frame dithering, see dither.py. Option --dither diffusion.
+#                        option --jobs N to encode in parallel.
+#                        streaming pipeline load -> resample -> dither -> pack -> BinWriter, option -o
+#                        option --cache DIR for a persistent frame cache, see frame_cache.py
+#                        option --resample area for anti-aliased sampling
+#                        option --update re-encodes only changed images, see manifest.py
+#                        option --delta re-encodes only changed rays, see delta_encode.py
+#                        option --upload streams to the device while encoding, see holo_upload.py
+#                        option --profile for per stage timing, see profiler.py
+#                        animated GIF, APNG and videos as input, resampled to the device fps, see video_source.py
 #
 
-version = '0.4'
+version = '0.5'
 
-from PIL import Image, ImageDraw
-import os, sys, math, random
+from PIL import Image
+import os, sys, math
+import numpy as np
+from polar_sample import get_sampler, samplers
+from bit_pack import pack_frame
+from dither import dither_frame, backends as dither_backends
+from bin_file import BinWriter, Frame, frame_block, pwrite_all, header_size, frame_size, padsize, fps
+from manifest import file_hash, load_manifest, save_manifest, remove_manifest
+from delta_encode import DeltaEncoder
+from frame_cache import FrameCache, frame_key, read_frame
+from holo_upload import StreamUpload
+from profiler import Profiler, noprof
+from video_source import VideoFrame, is_video, expand, frame_count, ffmpeg_suffixes
+import argparse, collections, shutil
+from concurrent.futures import ProcessPoolExecutor
 
 debug = False    # use small test values
 verbose = False  # print everthing...
 
 diam_def = 360        # input png image width
 n_rays = 2700         # 113400 / 42
-padsize = 1288        # number of \0 bytes between frames.
 leds = 224            # That is what the device says, (I did not count them :-))
 repeat_img = 1        # 1: full speed 10fps, 30: show each image 3sec
 
@@ -82,139 +109,304 @@ def polar2cart(cx, cy, r, phi):
   return (x, y)
 
 
-def rgb_bit_columns(x, width):
-  #            0   1   2   3   4   5   6   7
-  #           ---+---+---+---+---+---+---+---
-  zigzag_r = [ 16, 19, 22, 9,  12, 15, 2,  5 ]
-  zigzag_g = [ 17, 20, 23, 10, 13, 0,  3,  6 ]
-  zigzag_b = [ 18, 21, 8,  11, 14, 1,  4,  7 ]
-  o = width - 24 - x // 8 * 8 * 3
-  m = x % 8
-  return (o + zigzag_r[m], o + zigzag_g[m], o + zigzag_b[m])
-
-
-def ordered_dith(x, y, val):
-  """ val is expected in 0...255
-      x is used modulo 2
-      y is used modulo 12
-
-      The dither pattern has 13 different values. We duplicate the first and the last value to
-      stretch the typical video range of [16..240] back into [0..255]
-  """
-  dith = (
-    ( 0, 0, 0, 0, 0, 0,  0, 0, 0, 0, 0, 0 ),
-    ( 0, 0, 0, 0, 0, 0,  0, 0, 0, 0, 0, 0 ),
-    ( 1, 0, 0, 0, 0, 0,  0, 0, 0, 0, 0, 0 ),
-    ( 1, 0, 0, 0, 0, 0,  1, 0, 0, 0, 0, 0 ),
-    ( 1, 1, 0, 0, 0, 0,  1, 0, 0, 0, 0, 0 ),
-    ( 1, 1, 0, 0, 0, 0,  1, 1, 0, 0, 0, 0 ),
-    ( 1, 1, 1, 0, 0, 0,  1, 1, 0, 0, 0, 0 ),
-    ( 1, 1, 1, 0, 0, 0,  1, 1, 1, 0, 0, 0 ),
-    ( 1, 1, 1, 1, 0, 0,  1, 1, 1, 0, 0, 0 ),
-    ( 1, 1, 1, 1, 0, 0,  1, 1, 1, 1, 0, 0 ),
-    ( 1, 1, 1, 1, 1, 0,  1, 1, 1, 1, 0, 0 ),
-    ( 1, 1, 1, 1, 1, 0,  1, 1, 1, 1, 1, 0 ),
-    ( 1, 1, 1, 1, 1, 1,  1, 1, 1, 1, 1, 0 ),
-    ( 1, 1, 1, 1, 1, 1,  1, 1, 1, 1, 1, 1 ),
-    ( 1, 1, 1, 1, 1, 1,  1, 1, 1, 1, 1, 1 )
-  )
-  val = max(0, min(255, int(val)))      # clamp and
-  v14 = int(val / 17.01)                # squeeze into [0..14]
-  d = dith[v14]
-  y += 6 * (int(x) % 2)
-  return d[int(y) % 12]
-
-
-def encode_polar_bin(im, diam=diam_def, c_x=None, c_y=None):
+def polar_resample(im, diam=diam_def, c_x=None, c_y=None, resample='bilinear'):
   if c_x == None: c_x = (diam-1.)/2
   if c_y == None: c_y = (diam-1.)/2
-  pix = im.load()
-  # prepare a frame polar distortion
-  po_width = leds // 2 * 3
-  po = []
-  for i in range(po_width):
-    po.append([])
-
-  for n in range(n_rays):
-    phi = math.radians(360.*(n_rays-n)/n_rays)
-    sca = float(diam-1)/float(leds-1)
-    if verbose:
-      print("n=%d\t" % n, end='')
-    for led in range(leds//2):
-      (x,y) = polar2cart(c_x, c_y, (0.5+led) * sca, phi)
-      if verbose:
-        print("(%.2f, %.2f) " % (x,y), end="")
-      rgb = quad_avg(pix, x, y)
-      ### bit interleaved in 24 bits for 8 rings.
-      (cr,cg,cb) = rgb_bit_columns(led, po_width)
-      po[cr].append(rgb[0])
-      po[cg].append(rgb[1])
-      po[cb].append(rgb[2])
-
-    if verbose:
-      print("")
-
-  ## prepare a frame for the binary format
-  out = []
-  for n in range(n_rays):
-    out.append([0] * (3*leds//16))      # number of bytes = po_width / 8 = 42
-
-  for column in range(len(po)):
-    byte   =       column // 8
-    bitval = 1 << (column % 8)
+  # all rays at once. 'bilinear' gives the same values as quad_avg(pix, *polar2cart(...))
+  # per sample, 'area' averages over the footprint of each LED.
+  sampler = get_sampler(diam, c_x, c_y, n_rays, leds, resample)
+  if verbose and resample == 'bilinear':
     for n in range(n_rays):
-      val = po[column][n]
-      if ordered_dith(column, n, val):
-        out[n][byte] |= bitval;
-  return out
+      print("n=%d\t" % n + " ".join(["(%.2f, %.2f)" % xy for xy in zip(sampler.x[n], sampler.y[n])]))
+  return sampler.resample(im)
+
+
+def encode_polar_bin(im, diam=diam_def, c_x=None, c_y=None, dither='ordered', resample='bilinear', prof=noprof):
+  with prof.stage('resample'):
+    rgb = polar_resample(im, diam, c_x, c_y, resample)
+  # one dither decision per sample, see dither.py
+  with prof.stage('dither'):
+    bits = dither_frame(rgb, dither)
+  ## the frame in binary format, 42 bytes per ray.
+  with prof.stage('pack'):
+    return Frame(pack_frame(bits))
 
 
 def polar_bin_test(x=-1):
-  ## prepare a frame for the binary format
-  bytes_per_column = 3*leds//16
-  out = []
-  for n in range(n_rays):
-    out.append([0] * bytes_per_column)
-  out[0] = [255] * bytes_per_column
-
-  for n in range(n_rays-20):
-    if (n//20) < 128:
-      out[n][24] = n//20
-      out[n][26] = 128 + n//20
-    if (n//100) < 8:
-      out[n][10] = 1 << (n//100)
-      out[n][0] = 1 << (n//100)
-      out[n][1] = 1 << (n//100)
-      out[n][2] = 1 << (n//100)
-      out[n][3] = 1 << (n//100)
-      out[n][4] = 1 << (n//100)
-  return out
-
-
-o = open("rgb_enc_01.bin", "wb")
-header = [ 0x00, 0x00, 0x00, 0x3c, 0x18 ]               # seen with Gif-Anims
-# header = [ 0x00, 0x00, 0x00, 0x01, 0x18 ]             # seen with mp4
-padding = bytes([0] * padsize)
-
-for i in range(5, 0x1000):
-  header.append(random.randint(0,255))
-o.write(bytes(header))
-
-# for i in range(20):
-#   data = polar_bin_test(i)
-
-for imgfile in sys.argv[1:]:
-  if repeat_img > 1:
-    print("encoding %s (%d)..." % (imgfile, repeat_img))
+  ## a test frame: a white first ray, a ramp in bytes 24 and 26, single bits walking through bytes 0-4 and 10.
+  f = Frame()
+  rays = f.rays
+  rays[0] = 255
+  n = np.arange(n_rays-20)
+  ramp = n[n//20 < 128]
+  rays[ramp, 24] = ramp//20
+  rays[ramp, 26] = 128 + ramp//20
+  walk = n[n//100 < 8]
+  rays[walk[:, None], [0, 1, 2, 3, 4, 10]] = (1 << (walk//100))[:, None]
+  return f
+
+
+def open_image(imgfile):
+  """ imgfile is a file name or a video_source.VideoFrame, which brings its image along. """
+  if isinstance(imgfile, VideoFrame):
+    return imgfile.image
+  return Image.open(imgfile).convert('RGB')       # make sure it is RGB
+
+
+## The encoder as a pipeline of generators. Each stage takes and yields (name, data) pairs,
+## only one frame per stage is alive at a time. prof times each stage, see profiler.py.
+
+def load_images(imgfiles, prof=noprof):
+  for imgfile in imgfiles:
+    with prof.stage('decode', imgfile):
+      im = open_image(imgfile)
+    yield (imgfile, im)
+
+
+def resample_frames(frames, resample='bilinear', prof=noprof):
+  for name, im in frames:
+    with prof.stage('resample', name):
+      rgb = polar_resample(im, min(im.height, im.width), resample=resample)
+    yield (name, rgb)
+
+
+def dither_frames(frames, dither='ordered', prof=noprof):
+  for name, rgb in frames:
+    with prof.stage('dither', name):
+      bits = dither_frame(rgb, dither)
+    yield (name, bits)
+
+
+def pack_frames(frames, prof=noprof):
+  for name, bits in frames:
+    with prof.stage('pack', name):
+      data = Frame(pack_frame(bits))
+    yield (name, data)
+
+
+def encode_file(imgfile, dither='ordered', cache_dir=None, resample='bilinear', prof=noprof):
+  """
+     Returns (frame, cache_key, hit). Without a cache_dir the key is None.
+     The cache is only read here, so that this also works in a worker process.
+     The caller does the bookkeeping, see encode_files().
+  """
+  prof.frame = imgfile
+  with prof.stage('decode'):
+    im = open_image(imgfile)
+  diam = min(im.height, im.width)
+  key = None
+  if cache_dir:
+    with prof.stage('cache'):
+      key = frame_key(im, version, diam, None, None, n_rays, leds, dither, resample)
+      data = read_frame(cache_dir, key)
+    if data is not None:
+      return (Frame(data), key, True)
+  return (encode_polar_bin(im, diam, dither=dither, resample=resample, prof=prof), key, False)
+
+
+def encode_file_profiled(*args):
+  """ encode_file() in a worker process, returns its result and the profiler records. """
+  prof = Profiler()
+  return (encode_file(*args, prof=prof), prof.records)
+
+
+def encode_files(imgfiles, dither='ordered', jobs=1, cache=None, resample='bilinear', delta=None, prof=noprof):
+  """
+     Generator, yields (imgfile, frame) in input order.
+     With jobs > 1 the frames are encoded in a process pool. At most 2*jobs frames
+     are in flight, so memory stays bounded for long sequences.
+     cache is an optional FrameCache, frames found there are not encoded again.
+     delta is an optional DeltaEncoder, it only recomputes what changed since the
+     previous image. Serial, ordered dither and no cache only.
+     prof is an optional profiler.Profiler, the workers of the pool record in their own.
+  """
+  def cached(imgfile, result):
+    if prof.enabled and jobs > 1:
+      result, records = result
+      prof.add(records)
+    data, key, hit = result
+    if cache:
+      if hit:
+        cache.hit(key)
+      else:
+        cache.miss()
+        cache.put(key, data)
+    return (imgfile, data)
+
+  cache_dir = cache.dirname if cache else None
+  if delta:
+    for imgfile, im in load_images(imgfiles, prof):
+      with prof.stage('delta', imgfile):
+        data = delta.encode(im)
+      yield (imgfile, data)
+    return
+  if jobs <= 1:
+    if cache:
+      for imgfile in imgfiles:
+        yield cached(imgfile, encode_file(imgfile, dither, cache_dir, resample, prof))
+    else:
+      yield from pack_frames(dither_frames(resample_frames(load_images(imgfiles, prof), resample, prof), dither, prof), prof)
+    return
+  encode = encode_file_profiled if prof.enabled else encode_file
+
+  with ProcessPoolExecutor(max_workers=jobs) as pool:
+    pending = collections.deque()
+    for imgfile in imgfiles:
+      if len(pending) >= 2*jobs:
+        f, fut = pending.popleft()
+        yield cached(f, fut.result())
+      pending.append((imgfile, pool.submit(encode, imgfile, dither, cache_dir, resample)))
+    while pending:
+      f, fut = pending.popleft()
+      yield cached(f, fut.result())
+
+
+def update_bin(binfile, imgfiles, params, hashes, dither='ordered', jobs=1, cache=None, resample='bilinear', log=sys.stdout, prof=noprof):
+  """
+     Re-encode only the frames whose source hash differs from the manifest and overwrite
+     them in place. Returns False if the file has to be rebuilt, because there is no
+     manifest, the frame count changed or the encoder parameters differ.
+  """
+  m = load_manifest(binfile)
+  if m is None or m.get('params') != params or len(m.get('frames', [])) != len(imgfiles):
+    return False
+  stride = frame_size + padsize
+  try:
+    if os.stat(binfile).st_size != header_size + len(imgfiles) * repeat_img * stride:
+      return False
+  except OSError:
+    return False
+
+  changed = [i for i in range(len(imgfiles)) if m['frames'][i]['hash'] != hashes[i]]
+  fd = os.open(binfile, os.O_WRONLY)
+  try:
+    for i, (imgfile, data) in zip(changed, encode_files([imgfiles[i] for i in changed], dither, jobs, cache, resample, prof=prof)):
+      print("updating %s ..." % imgfile, file=log)
+      with prof.stage('write', imgfile):
+        block = frame_block(data, padsize)
+        offset = m['frames'][i]['offset']
+        for rep in range(repeat_img):
+          pwrite_all(fd, block, offset + rep * len(block))
+      m['frames'][i]['hash'] = hashes[i]
+  finally:
+    os.close(fd)
+  for i, imgfile in enumerate(imgfiles):
+    m['frames'][i]['source'] = imgfile
+  save_manifest(binfile, m)
+  print("%s: %d of %d frames updated" % (binfile, len(changed), len(imgfiles)), file=log)
+  return True
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Encode images into a .bin file for the 224 LED holographic propeller display.')
+  parser.add_argument('-o', '--output', default='rgb_enc_01.bin', help="Output file, '-' for stdout. Default: rgb_enc_01.bin")
+  parser.add_argument('--dither', default='ordered', choices=sorted(dither_backends.keys()), help="Dither method. Default: ordered")
+  parser.add_argument('--resample', default='bilinear', choices=sorted(samplers.keys()), help="bilinear: one sample per LED, area: average over the LED footprint (anti-aliased). Default: bilinear")
+  parser.add_argument('-j', '--jobs', default=1, type=int, help="Number of encoder processes. Default: 1")
+  parser.add_argument('--cache', metavar='DIR', help="Keep encoded frames in DIR and reuse them for unchanged images.")
+  parser.add_argument('--cache-size', metavar='MB', default=1024, type=int, help="Size limit of the cache, least recently used frames are removed. Default: 1024")
+  parser.add_argument('--delta', action='store_true', help="Re-encode only the rays that changed since the previous image. Good for mostly static animations. Needs ordered dither, no --jobs, no --cache.")
+  parser.add_argument('-u', '--update', action='store_true', help="Keep a manifest next to the output file and re-encode only images that changed since the last run.")
+  parser.add_argument('--upload', metavar='ADDRESS', help="Upload to the device at ADDRESS while encoding, e.g. 192.168.4.1. The output name is used on the device, no file is written.")
+  parser.add_argument('--upload-port', default=5499, type=int, help="TCP port for --upload. Default: 5499")
+  parser.add_argument('--profile', action='store_true', help="Time each stage of each frame and print a summary.")
+  parser.add_argument('--profile-out', metavar='FILE', help="With --profile: also write the timings as JSON trace events, e.g. for chrome://tracing.")
+  parser.add_argument('images', metavar='IMAGE', nargs='*', help="Image files, one frame each.")
+  args = parser.parse_args()
+
+  if args.update and args.output == '-':
+    parser.error("--update needs an output file")
+  videos = [f for f in args.images if is_video(f)]
+  if args.update and videos:
+    parser.error("--update works with still images only, not with %s" % videos[0])
+  if [f for f in videos if f.lower().endswith(ffmpeg_suffixes)] and not shutil.which('ffmpeg'):
+    parser.error("videos need ffmpeg, see https://ffmpeg.org. Animated GIF and APNG work without.")
+  if args.upload and (args.update or args.output == '-'):
+    parser.error("--upload needs an output name and does not work with --update")
+  delta = None
+  if args.delta:
+    if args.dither != 'ordered' or args.jobs > 1 or args.cache:
+      parser.error("--delta works with ordered dither only, and not together with --jobs or --cache")
+    delta = DeltaEncoder(n_rays, leds, args.resample)
+
+  prof = Profiler() if args.profile or args.profile_out else noprof
+
+  cache = None
+  if args.cache:
+    cache = FrameCache(args.cache, args.cache_size * 1000000)
+
+  if args.output == '-':
+    log = sys.stderr          # keep stdout clean for the data
   else:
-    print("encoding %s ..." % imgfile)
-  im = Image.open(imgfile).convert('RGB')       # make sure it is RGB
-  data = encode_polar_bin(im, min(im.height, im.width))
+    log = sys.stdout
+
+  if args.update:
+    params = { 'version': version, 'n_rays': n_rays, 'leds': leds, 'padsize': padsize, 'repeat': repeat_img,
+               'dither': args.dither, 'resample': args.resample }
+    hashes = [file_hash(f) for f in args.images]
+    if update_bin(args.output, args.images, params, hashes, args.dither, args.jobs, cache, args.resample, log, prof):
+      if cache:
+        print(cache.stats(), file=log)
+      if prof.enabled:
+        prof.summary(log)
+        if args.profile_out:
+          prof.write(args.profile_out)
+      sys.exit(0)
+    print("%s: full rebuild" % args.output, file=log)
 
-  for rep in range(repeat_img):
-    for row in data:
-      o.write(bytes(row))
-    o.write(padding)
+  nframes = len(args.images) * repeat_img
+  if videos:
+    # an extra pass over the animations. Only needed if the size must be known up front.
+    nframes = args.upload and sum(frame_count(f, fps) if f in videos else repeat_img for f in args.images)
+  if args.upload:
+    # the size goes into the first packet, before any frame is encoded.
+    size = header_size + nframes * (frame_size + padsize)
+    try:
+      o = StreamUpload(args.upload, os.path.basename(args.output), size, args.upload_port)
+    except (ValueError, OSError) as e:
+      parser.error("--upload: %s" % e)
+  elif args.output == '-':
+    o = sys.stdout.buffer
+  else:
+    o = open(args.output, "wb")
+    remove_manifest(args.output)          # --update writes a new one when done
+  w = BinWriter(o, padsize, nframes)
 
-o.close()
+  # for i in range(20):
+  #   data = polar_bin_test(i)
+
+  frames = []           # only kept for the manifest of --update, which has no videos
+  data = None
+  for imgfile, data in encode_files(expand(args.images, fps), args.dither, args.jobs, cache, args.resample, delta, prof):
+    rep = getattr(imgfile, 'repeat', repeat_img)
+    if args.upload:
+      rep = min(rep, nframes - w.frames)    # the frame count of a video was estimated
+    if rep > 1:
+      print("encoding %s (%d)..." % (imgfile, rep), file=log)
+    else:
+      print("encoding %s ..." % imgfile, file=log)
+    if args.update:
+      frames.append({ 'source': str(imgfile), 'offset': w.pos, 'repeat': rep })
+    with prof.stage('write', imgfile):
+      w.write_frame(data, rep)
+    if isinstance(imgfile, VideoFrame):
+      imgfile.image = None                  # encoded, do not keep the decoded image
+  if args.upload and w.frames < nframes and data is not None:
+    w.write_frame(data, nframes - w.frames)
 
+  with prof.stage('close', args.output):
+    w.close()
+  if args.upload:
+    print("%s uploaded to %s: %s" % (os.path.basename(args.output), args.upload, o.stats()), file=log)
+  if delta:
+    print(delta.stats(), file=log)
+  if args.update:
+    for f, h in zip(frames, hashes):
+      f['hash'] = h
+    save_manifest(args.output, { 'params': params, 'frames': frames })
+  if cache:
+    print(cache.stats(), file=log)
+  if prof.enabled:
+    prof.summary(log)
+    if args.profile_out:
+      prof.write(args.profile_out)
@@ -0,0 +1,336 @@
+#! /usr/bin/python3
+#
+# fleet.py -- drive a wall of propeller displays at once.
+#
+# Looping over led-hologram.py -a IP is serial: every dead device costs its timeouts,
+# every upload takes a minute. Here all devices are handled concurrently by one asyncio
+# loop. Same protocols as holo_proto.py and holo_upload.py, same pacing as upload_pacer.py.
+#
+#  - Each Device runs one operation at a time (limit), the device firmware is simple.
+#  - At most jobs uploads run at the same time, they share the WiFi.
+#  - A device that fails or times out only fails its own result, the others go on.
+#  - During uploads the aggregate progress of all devices is printed.
+#
+# Devices are ADDRESS[:PORT[:UPPORT]], from -a or from a hosts file with one per line.
+#
+# Usage:
+#  $0 -a IP [-a IP ...] [-f HOSTS] [-j N] status|pause|play
+#  $0 -f HOSTS delete N
+#  $0 -f HOSTS upload FILE.bin [NAME.bin]
+#  $0 --sim N [-b KB/s] [-j N] upload FILE.bin          benchmark against N local device_sim.py
+#
+# 2026-10-18, v0.1 -- initial draft.
+#
+
+import os, sys, time, mmap, asyncio, argparse
+from holo_proto import message_end, parse_status, command, CMD_PAUSE, CMD_PLAY, CMD_STATUS, CMD_DELETE
+from holo_upload import PACKET_SIZE, PacketSender, name_packet, end_packet, chunksize, check_name
+from upload_pacer import Pacer, device_timeout
+from hologram_client import Uploaded
+
+
+def parse_device(spec):
+  """ 'ADDRESS[:PORT[:UPPORT]]' -> (address, port, upport) """
+  parts = spec.split(':')
+  if len(parts) > 3:
+    raise ValueError("bad device '%s', expected ADDRESS[:PORT[:UPPORT]]" % spec)
+  return (parts[0],) + tuple(int(p) for p in parts[1:]) + (5233, 5499)[len(parts)-1:]
+
+
+class Device:
+  """
+     One propeller display. Control commands keep their connection to port 5233 open,
+     like HologramClient, uploads open their own to port 5499. At most limit
+     operations run at the same time.
+  """
+  def __init__(self, address, port=5233, upport=5499, timeout=3.0, retries=1, limit=1,
+               min_rate=47e3, max_rate=1e6, verbose=False):
+    self.address = address
+    self.port = int(port)
+    self.upport = int(upport)
+    self.timeout = timeout
+    self.retries = retries
+    self.min_rate = min_rate
+    self.max_rate = max_rate
+    self.verbose = verbose
+    self.lock = asyncio.Semaphore(limit)
+    self.reader = self.writer = None
+    self.buf = bytearray()
+    self.connects = 0
+    self.done = self.size = 0     # upload progress in bytes
+    self.pacer = None
+
+  def __str__(self):
+    if (self.port, self.upport) == (5233, 5499):
+      return self.address
+    return "%s:%d:%d" % (self.address, self.port, self.upport)
+
+  async def open_connection(self, port):
+    try:
+      return await asyncio.wait_for(asyncio.open_connection(self.address, port), self.timeout)
+    except asyncio.TimeoutError:
+      raise TimeoutError("cannot connect to %s:%d within %.1f sec" % (self.address, port, self.timeout))
+
+  async def connect(self):
+    self.disconnect()
+    self.reader, self.writer = await self.open_connection(self.port)
+    self.buf = bytearray()
+    self.connects += 1
+
+  def disconnect(self):
+    if self.writer:
+      self.writer.close()
+    self.reader = self.writer = None
+
+  async def read_message(self):
+    while True:
+      n = message_end(self.buf)
+      if n:
+        msg = bytes(self.buf[:n])
+        del self.buf[:n]
+        return msg
+      data = await self.reader.read(4096)
+      if not data:
+        raise ConnectionError("connection closed by the device")
+      self.buf += data
+
+  async def request(self, msg, idempotent=True):
+    """ Send one command message, return the reply as bytes. """
+    async with self.lock:
+      for attempt in range(self.retries + 1 if idempotent else 1):
+        try:
+          if not self.writer:
+            await self.connect()
+          self.writer.write(msg)
+          try:
+            reply = await asyncio.wait_for(self.read_message(), self.timeout)
+          except asyncio.TimeoutError:
+            raise TimeoutError("no reply from %s:%d within %.1f sec" % (self.address, self.port, self.timeout))
+          if self.verbose:
+            print("%s: received %s" % (self, reply))
+          return reply
+        except OSError:
+          self.disconnect()       # also drops a late reply, it cannot be confused with the next one
+          if attempt == self.retries or not idempotent:
+            raise
+
+  async def pause(self):
+    return parse_status(await self.request(command(CMD_PAUSE)))
+
+  async def play(self):
+    return parse_status(await self.request(command(CMD_PLAY)))
+
+  async def status(self):
+    return parse_status(await self.request(command(CMD_STATUS)))
+
+  async def delete(self, idx):
+    if idx <= 0 or idx > 99:
+      raise ValueError("delete index must be between 1 and 99, not %d" % idx)
+    return parse_status(await self.request(command(CMD_DELETE, idx), idempotent=False))
+
+  async def read_replies(self, reader, pacer, replied):
+    while True:
+      data = await reader.read(1024)
+      if not data:
+        pacer.eof = True
+        replied.set()
+        return
+      if pacer.feed(data):
+        replied.set()
+
+  async def wait_reply(self, replied, timeout):
+    """ Like Pacer.wait_reply(), but the replies come from read_replies() """
+    try:
+      await asyncio.wait_for(replied.wait(), timeout)
+    except asyncio.TimeoutError:
+      pass
+    replied.clear()
+
+  async def upload(self, path, name=None):
+    """ Upload a .bin file, as name or under its own basename. Returns an Uploaded. """
+    name = name or os.path.basename(path)
+    check_name(name)
+    size = os.stat(path).st_size
+    if size == 0:
+      raise ValueError("%s is empty" % path)
+    async with self.lock:
+      t0 = time.monotonic()
+      self.done, self.size = 0, size
+      reader, writer = await self.open_connection(self.upport)
+      # keep the packets in the kernel, where the pacer can see the queue.
+      writer.transport.set_write_buffer_limits(high=4*PACKET_SIZE)
+      self.pacer = pacer = Pacer(writer.get_extra_info('socket'), self.min_rate, self.max_rate, verbose=self.verbose)
+      pacer.blocking = False
+      replied = asyncio.Event()
+      replies = asyncio.create_task(self.read_replies(reader, pacer, replied))
+      # the transport may keep a reference to what it could not send yet, but the sender reuses its packet.
+      sender = PacketSender(lambda packet: writer.write(bytes(packet)))
+      try:
+        writer.write(name_packet(name, size))
+        await self.wait_reply(replied, 1.0)       # 0AfJffff
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+          data = memoryview(mm)
+          try:
+            for off in range(0, size, chunksize):
+              await asyncio.sleep(pacer.delay())
+              t1 = time.monotonic()
+              sender.write(data[off:off+chunksize])   # one packet, a short last one goes out with close()
+              if off + chunksize >= size:
+                pad = sender.close()
+              await asyncio.wait_for(writer.drain(), device_timeout)
+              pacer.sent(PACKET_SIZE, time.monotonic() - t1)
+              while pacer.stalling and not pacer.drained():
+                await asyncio.sleep(0.05)
+              if pacer.eof:
+                raise ConnectionError("upload connection closed by the device")
+              self.done = min(size, off + chunksize)
+          finally:
+            data.release()
+        writer.write(end_packet)
+        if writer.can_write_eof():
+          writer.write_eof()
+        await asyncio.wait_for(writer.drain(), self.timeout)
+        # the device may still be reading its receive buffer. Closing now would reset the
+        # connection and lose the rest, so wait while the acks come, until the device closes.
+        confirmed = True
+        while not pacer.eof:
+          replied.clear()
+          try:
+            await asyncio.wait_for(replied.wait(), self.timeout)
+          except asyncio.TimeoutError:
+            confirmed = False
+            break
+      except asyncio.TimeoutError:
+        raise TimeoutError("%s: upload stalled, the device will play the partial file" % self)
+      finally:
+        replies.cancel()
+        writer.close()
+      if not confirmed:
+        raise TimeoutError("%s: the device did not confirm the end of %s within %.1f sec, it may have lost data" % (
+          self, name, self.timeout))
+      return Uploaded(name, size, pad, time.monotonic() - t0, pacer.stats())
+
+  async def do(self, cmd, *args):
+    """ One command with its arguments as words, like HologramClient.do() """
+    if cmd in ('pause', 'play', 'status') and not args:
+      return await getattr(self, cmd)()
+    if cmd in ('del', 'delete') and len(args) == 1:
+      return await self.delete(int(args[0]))
+    if cmd == 'upload' and len(args) in (1, 2):
+      return await self.upload(*args)
+    raise ValueError("unknown command or wrong arguments: %s" % ' '.join((cmd,) + args))
+
+
+class Fleet:
+  """
+     Runs the same command on all devices. At most jobs uploads at the same time.
+     progress(fleet) is called every interval seconds while a command runs.
+  """
+  def __init__(self, devices, jobs=4, progress=None, interval=0.5):
+    self.devices = devices
+    self.jobs = jobs
+    self.progress = progress
+    self.interval = interval
+    self.uploads = None
+    self.t_start = None
+
+  def totals(self):
+    """ (bytes done, bytes to do, bytes per second so far) over all devices """
+    done = sum(d.done for d in self.devices)
+    size = sum(d.size for d in self.devices)
+    return done, size, done / max(1e-6, time.monotonic() - self.t_start)
+
+  async def one(self, device, cmd, args):
+    if cmd == 'upload':
+      async with self.uploads:
+        return await device.do(cmd, *args)
+    return await device.do(cmd, *args)
+
+  async def report(self):
+    while True:
+      await asyncio.sleep(self.interval)
+      self.progress(self)
+
+  async def run(self, cmd, *args):
+    """ Returns a list of (device, result), the result is an exception if the device failed. """
+    self.uploads = asyncio.Semaphore(self.jobs)
+    self.t_start = time.monotonic()
+    reporter = self.progress and asyncio.create_task(self.report())
+    try:
+      results = await asyncio.gather(*(self.one(d, cmd, args) for d in self.devices), return_exceptions=True)
+    finally:
+      if reporter:
+        reporter.cancel()
+      for d in self.devices:
+        d.disconnect()
+    return list(zip(self.devices, results))
+
+
+def read_hosts(path):
+  with open(path) as f:
+    return [w for line in f for w in line.split('#', 1)[0].split()]
+
+
+def fmt_result(r):
+  if isinstance(r, BaseException):
+    return "ERROR: %s" % (str(r) or r.__class__.__name__)
+  if isinstance(r, Uploaded):
+    return "%s, %d bytes + %d padding, %.1f sec, %s" % (r.name, r.size, r.padding, r.seconds, r.stats)
+  playing = { True: 'playing', False: 'paused' }.get(r.playing, 'unknown')
+  return "%d files, %s %02d %s" % (len(r.files), playing, r.current, r.name(r.current) or '')
+
+
+def print_progress(fleet):
+  done, size, rate = fleet.totals()
+  busy = sum(0 < d.done < d.size for d in fleet.devices)
+  print("\r%5.1f%%  %.1f of %.1f MB, %d uploading at %.1f KB/s " % (
+    100. * done / max(1, size), done / 1e6, size / 1e6, busy, rate / 1e3), end='')
+  sys.stdout.flush()
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Send a command to many 224 LED holographic propeller displays at once.')
+  parser.add_argument('-a', '--address', action='append', default=[], help="Device ADDRESS[:PORT[:UPPORT]], can be repeated.")
+  parser.add_argument('-f', '--hosts', help="File with one device ADDRESS[:PORT[:UPPORT]] per line.")
+  parser.add_argument('-j', '--jobs', default=4, type=int, help="Uploads at the same time. Default: 4")
+  parser.add_argument('-t', '--timeout', default=3., type=float, help="Seconds to wait for a connection or reply. Default: 3")
+  parser.add_argument('--min-rate', default=47., type=float, help="Upload rate floor per device in KB/s. Default: 47")
+  parser.add_argument('--max-rate', default=1000., type=float, help="Upload rate ceiling per device in KB/s. Default: 1000")
+  parser.add_argument('--sim', default=0, type=int, metavar='N', help="Benchmark: start N simulated devices on localhost and use them.")
+  parser.add_argument('-b', '--bandwidth', type=float, help="Upload bandwidth of each simulated device in KB/s. Default: unlimited")
+  parser.add_argument('-v', '--verbose', default=False, action='store_true', help="Print the replies.")
+  parser.add_argument('cmd', nargs='+', help="status, pause, play, delete N or upload FILE.bin [NAME.bin]")
+  args = parser.parse_args()
+
+  specs = args.address + (read_hosts(args.hosts) if args.hosts else [])
+  sims = []
+  if args.sim:
+    from device_sim import DeviceSim
+    sims = [DeviceSim(port=0, upport=0, bandwidth=args.bandwidth and args.bandwidth*1e3).start() for i in range(args.sim)]
+    specs += ["%s:%d:%d" % (s.address, s.port, s.upport) for s in sims]
+  if not specs:
+    parser.error("no devices, use -a, -f or --sim")
+
+  async def run():
+    devices = [Device(*parse_device(spec), timeout=args.timeout, min_rate=args.min_rate*1e3,
+                      max_rate=args.max_rate*1e3, verbose=args.verbose) for spec in specs]
+    fleet = Fleet(devices, args.jobs, print_progress if args.cmd[0] == 'upload' else None)
+    return await fleet.run(*args.cmd)
+
+  t0 = time.monotonic()
+  results = asyncio.run(run())
+  secs = time.monotonic() - t0
+  if args.cmd[0] == 'upload':
+    print()
+  failed = 0
+  for device, r in results:
+    print("%-21s %s" % (device, fmt_result(r)))
+    failed += isinstance(r, BaseException)
+  print("%d devices, %d failed, %.2f sec" % (len(results), failed, secs))
+  for s in sims:
+    s.stop()
+  sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,109 @@
+#! /usr/bin/python3
+#
+# frame_cache.py -- persistent, content addressed cache of encoded frames.
+#
+# The key is a hash over the decoded pixels and all parameters that influence the
+# encoding (geometry, dither mode, encoder version). Each entry is one file named
+# after its key, holding the packed 113400 byte frame. The modification time of a
+# file is its LRU timestamp, the oldest entries are removed when the cache grows
+# beyond max_bytes.
+#
+
+import os, hashlib, collections
+
+suffix = '.frm'
+
+
+def frame_key(im, *params):
+  """
+     im is a PIL image, params are the encoding parameters, e.g.
+     (version, diam, c_x, c_y, n_rays, leds, dither). Returns a hex digest.
+  """
+  h = hashlib.sha256()
+  h.update(repr(params).encode('UTF-8'))
+  h.update(("%s %d %d" % (im.mode, im.width, im.height)).encode('UTF-8'))
+  h.update(im.tobytes())
+  return h.hexdigest()
+
+
+def read_frame(dirname, key):
+  """ Returns the cached bytes or None. No bookkeeping, safe to call from worker processes. """
+  try:
+    with open(os.path.join(dirname, key + suffix), 'rb') as f:
+      return f.read()
+  except FileNotFoundError:
+    return None
+
+
+class FrameCache:
+  def __init__(self, dirname, max_bytes=1024*1024*1024):
+    self.dirname = dirname
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    os.makedirs(dirname, exist_ok=True)
+    ents = []
+    for e in os.scandir(dirname):
+      if e.name.endswith(suffix) and e.is_file():
+        st = e.stat()
+        ents.append((st.st_mtime, e.name[:-len(suffix)], st.st_size))
+    self.lru = collections.OrderedDict()        # key -> size, oldest first
+    self.size = 0
+    for mtime, key, size in sorted(ents):
+      self.lru[key] = size
+      self.size += size
+
+  def path(self, key):
+    return os.path.join(self.dirname, key + suffix)
+
+  def get(self, key):
+    data = read_frame(self.dirname, key)
+    if data is None:
+      self.miss()
+    else:
+      self.hit(key)
+    return data
+
+  def miss(self):
+    self.misses += 1
+
+  def hit(self, key):
+    """ Record a hit that was looked up with read_frame(). """
+    self.hits += 1
+    try:
+      os.utime(self.path(key))
+    except FileNotFoundError:
+      return
+    size = self.lru.pop(key, None)
+    if size is None:                  # stored by someone else after we scanned the directory
+      size = os.stat(self.path(key)).st_size
+      self.size += size
+    self.lru[key] = size
+
+  def put(self, key, data):
+    """ Store a frame, usually after a miss. data is bytes or anything else with the buffer protocol. """
+    size = memoryview(data).nbytes
+    tmp = self.path(key) + '.%d' % os.getpid()
+    with open(tmp, 'wb') as f:
+      f.write(data)
+    os.replace(tmp, self.path(key))       # atomic, readers never see a partial frame
+    self.size += size - self.lru.pop(key, 0)
+    self.lru[key] = size
+    self.evict()
+
+  def evict(self):
+    while self.size > self.max_bytes and len(self.lru) > 1:
+      key, size = self.lru.popitem(last=False)
+      try:
+        os.unlink(self.path(key))
+      except FileNotFoundError:
+        pass
+      self.size -= size
+      self.evictions += 1
+
+  def stats(self):
+    total = self.hits + self.misses
+    return "cache %s: %d hits, %d misses (%.0f%% hit rate), %d evicted, %d frames, %.1f MB" % (
+      self.dirname, self.hits, self.misses, 100. * self.hits / max(1, total), self.evictions,
+      len(self.lru), self.size / 1e6)
@@ -0,0 +1,144 @@
+#! /usr/bin/python3
+#
+# holo_proto.py -- the control protocol of port 5233, see doc/upload-protocol.txt.
+#
+# Commands are c0eeb7c9baa3020000000014cc + code + lfh + bfb5d2a2, delete has lfj and the
+# two digit index instead of lfh. The device answers every command with the listing:
+#
+#   c0eeb7c9baa3020000000012cc38lnt {LLNNname.bin} CCHE1P bfb5d2a2
+#
+# LL is len(name)+2, NN the index, CC the current index and P is 1 when playing.
+#
+# Reader collects the bytes from a socket and returns each message as soon as it is
+# complete, instead of a single recv() with a guessed timeout. A listing is complete
+# when the entries, walked by their length fields, end in the HE footer and the trailer.
+# Other messages end at the first trailer.
+#
+# parse_status() turns a listing into a Status.
+#
+
+import time, select, collections
+
+CMD_HEADER  = b'c0eeb7c9baa3020000000014cc'
+LIST_HEADER = b'c0eeb7c9baa3020000000012cc'
+TRAILER     = b'bfb5d2a2'
+list_prefix = len(LIST_HEADER) + 5          # 38lnt, the letters vary: lnt, lmm, lpj
+
+CMD_PAUSE   = b'34'
+CMD_PLAY    = b'35'
+CMD_STATUS  = b'38'
+CMD_DELETE  = b'39'
+
+
+def command(code, idx=None):
+  """ The message for a command code, idx is the file index for CMD_DELETE. """
+  if idx is None:
+    return CMD_HEADER + code + b'lfh' + TRAILER
+  return CMD_HEADER + code + b'lfj' + b'%02d' % idx + TRAILER
+
+
+def message_end(buf):
+  """ Length of the complete message at the start of buf, or None if it is not complete yet. """
+  if buf[:len(LIST_HEADER)] == LIST_HEADER:
+    pos = list_prefix
+    while len(buf) >= pos + 4:
+      if buf[pos+2:pos+4] == b'HE':
+        end = pos + 6 + len(TRAILER)
+        if len(buf) < end:
+          return None
+        if buf[pos+6:end] == TRAILER:
+          return end
+        break                                 # not what we expected, fall back to the trailer
+      try:
+        pos += 2 + int(buf[pos:pos+2])
+      except ValueError:
+        break
+    else:
+      return None
+  i = buf.find(TRAILER)
+  return None if i < 0 else i + len(TRAILER)
+
+
+class Status(collections.namedtuple('Status', 'files current playing')):
+  """
+     files is a list of (index, name) in device order, current the index of the file
+     shown, playing is False when paused and None for a flag we do not know.
+  """
+  def name(self, idx):
+    return dict(self.files).get(idx)
+
+
+def parse_status(msg):
+  """
+     b'c0eeb7c9baa3020000000012cc38lnt200100_green_earth.bin200201_green_earth.bin02HE10bfb5d2a2'
+     -> Status(files=[(1, '00_green_earth.bin'), (2, '01_green_earth.bin')], current=2, playing=False)
+     Raises ValueError if msg is not a listing.
+  """
+  footer = msg[-len(TRAILER)-6:-len(TRAILER)]   # 02HE10
+  if msg[:len(LIST_HEADER)] != LIST_HEADER or msg[-len(TRAILER):] != TRAILER or footer[2:4] != b'HE':
+    raise ValueError("not a listing: %s" % msg)
+  files = []
+  pos = list_prefix
+  end = len(msg) - len(TRAILER) - 6
+  while pos < end:
+    n = int(msg[pos:pos+2])
+    files.append((int(msg[pos+2:pos+4]), msg[pos+4:pos+2+n].decode('UTF-8', 'replace')))
+    pos += 2 + n
+  if pos != end:
+    raise ValueError("listing entries do not add up: %s" % msg)
+  # never fetch a single element from a bytes array! b'1' becomes 49 then.
+  return Status(files, int(footer[:2]), { b'1': True, b'0': False }.get(footer[5:6]))
+
+
+class Reader:
+  """
+     Messages from socket s. read() waits at most timeout seconds, but returns as soon
+     as a complete message is there. A closed connection raises ConnectionError in
+     read(), drain() only sets eof.
+  """
+  def __init__(self, s):
+    self.s = s
+    self.buf = bytearray()
+    self.eof = False
+
+  def fill(self, timeout):
+    """ One recv() of what is available within timeout seconds. False on timeout. """
+    if not select.select([self.s], [], [], max(0, timeout))[0]:
+      return False
+    data = self.s.recv(4096)
+    if not data:
+      self.eof = True
+      raise ConnectionError("connection closed by the device")
+    self.buf += data
+    return True
+
+  def pop(self):
+    """ The complete message at the start of the buffer, or None """
+    n = message_end(self.buf)
+    if not n:
+      return None
+    msg = bytes(self.buf[:n])
+    del self.buf[:n]
+    return msg
+
+  def read(self, timeout=3.0):
+    """ The next complete message as bytes, or None on timeout. """
+    end = time.monotonic() + timeout
+    while True:
+      msg = self.pop()
+      if msg is not None or not self.fill(end - time.monotonic()):
+        return msg
+
+  def drain(self):
+    """ All complete messages that have already arrived, without waiting. """
+    try:
+      while self.fill(0):
+        pass
+    except (OSError, ValueError):       # closed by the device, or by us
+      self.eof = True
+    msgs = []
+    while True:
+      msg = self.pop()
+      if msg is None:
+        return msgs
+      msgs.append(msg)
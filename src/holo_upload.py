@@ -0,0 +1,207 @@
+#! /usr/bin/python3
+#
+# holo_upload.py -- the packets of the upload port 5499.
+#
+# A file goes up as a name packet, then data packets of 1460 bytes with 1432 bytes of
+# payload each, then an end packet. The last data packet is padded with '0' characters
+# (not \0), and the size in the name packet includes that padding.
+# See doc/upload-protocol.txt.
+#
+# PacketSender keeps one preallocated data packet per connection. Header and trailer
+# are written once, the payload region is filled straight from the source buffers
+# (e.g. a memoryview of an mmapped .bin file) and the packet goes out with sendall().
+# No packet is assembled by concatenation, short writes are handled by sendall() or
+# raise, they never go unnoticed.
+#
+# Upload is one file upload, paced by upload_pacer.Pacer. StreamUpload is the same as
+# a file object, so that the encoder can upload while it encodes, without a file on disk.
+#
+
+import time, queue, socket, threading
+from upload_pacer import Pacer
+
+PACKET_SIZE      = 1460
+PACKET_HEADER    = b'd3e0c9ba02014dd8'
+PACKET_TYPE_NAME = b'0AgQ'
+PACKET_TYPE_DATA = b'1GnH'
+PACKET_TYPE_END  = b'1AfF'
+PACKET_TRAILER   = b'bfb5d2a2'
+
+payload_offset = len(PACKET_HEADER) + len(PACKET_TYPE_DATA)
+chunksize      = PACKET_SIZE - payload_offset - len(PACKET_TRAILER)     # 1432
+end_packet     = PACKET_HEADER + PACKET_TYPE_END + PACKET_TRAILER
+
+
+def padded_size(size):
+  """ size rounded up to whole data packets. This is what the name packet announces. """
+  return -(-size // chunksize) * chunksize
+
+
+def name_packet(name, size):
+  """ size is the file size without padding """
+  # fools! Why is the length of the name not here?
+  return PACKET_HEADER + PACKET_TYPE_NAME + padded_size(size).to_bytes(4, 'big') + name.encode('UTF-8') + PACKET_TRAILER
+
+
+class PacketSender:
+  """
+     send(packet) transmits one packet completely, e.g. socket.sendall or Pacer.send.
+     It must not keep a reference, the packet buffer is reused.
+     Feed the file with write() as often as needed, then close() pads and sends the last packet.
+  """
+  def __init__(self, send):
+    self.send = send
+    self.packet = bytearray(PACKET_SIZE)
+    self.packet[:payload_offset] = PACKET_HEADER + PACKET_TYPE_DATA
+    self.packet[payload_offset+chunksize:] = PACKET_TRAILER
+    self.payload = memoryview(self.packet)[payload_offset:payload_offset+chunksize]
+    self.fill = 0
+    self.packets = 0
+    self.bytes = 0
+
+  def write(self, buf):
+    """ buf is anything with the buffer protocol """
+    buf = memoryview(buf).cast('B')
+    size = len(buf)
+    pos = 0
+    if self.fill:                               # top up the packet left over from the last write()
+      pos = min(chunksize - self.fill, size)
+      self.payload[self.fill:self.fill+pos] = buf[:pos]
+      self.fill += pos
+      if self.fill < chunksize:
+        self.bytes += size
+        return
+      self.flush()
+    end = pos + (size - pos) // chunksize * chunksize
+    payload, send, packet = self.payload, self.send, self.packet
+    for off in range(pos, end, chunksize):
+      payload[:] = buf[off:off+chunksize]
+      send(packet)
+    self.packets += (end - pos) // chunksize
+    self.fill = size - end
+    payload[:self.fill] = buf[end:]
+    self.bytes += size
+
+  def flush(self):
+    self.send(self.packet)
+    self.packets += 1
+    self.fill = 0
+
+  def close(self):
+    """ Pad and send the last packet. Returns the number of padding bytes. """
+    pad = 0
+    if self.fill:
+      pad = chunksize - self.fill
+      self.payload[self.fill:] = b'0' * pad       # fools! Don't you know the difference between "0" and "\0" ?
+      self.flush()
+    return pad
+
+
+def check_name(name):
+  """ The device wants a .bin suffix and at most 99 bytes, else ValueError. """
+  if not name.endswith('.bin'):
+    raise ValueError("need a filename with '.bin' suffix. Got: '%s'" % name)
+  if len(name.encode('UTF-8')) > 99:
+    raise ValueError("filename '%s' is %d bytes long. Maximum: 99" % (name, len(name.encode('UTF-8'))))
+
+
+class Upload:
+  """
+     One file upload over port 5499. size is the file size without padding. It must be
+     known before the first byte, the device wants it in the name packet.
+     write() the data in pieces of any size, then close().
+     cpu is the cpu time spent in connecting, write() and close(), measured in the
+     thread that runs them, so the work of a producer in another thread is not counted.
+  """
+  def __init__(self, address, name, size, port=5499, min_rate=47e3, max_rate=1e6, verbose=False, timeout=3.):
+    check_name(name)
+    self.name = name
+    self.size = size
+    self.timeout = timeout
+    c0 = time.thread_time()
+    self.sock = socket.create_connection((address, int(port)), timeout)
+    self.pacer = Pacer(self.sock, min_rate, max_rate, verbose=verbose)
+    self.sock.sendall(name_packet(name, size))
+    self.pacer.wait_reply(1.0)                  # 0AfJffff
+    self.sender = PacketSender(self.pacer.send)
+    self.cpu = time.thread_time() - c0
+
+  def write(self, buf):
+    c0 = time.thread_time()
+    self.sender.write(buf)
+    self.cpu += time.thread_time() - c0
+
+  def close(self):
+    """
+       Pad, send the end packet and close the connection. Returns the number of padding bytes.
+       If the amount written differs from size, no end packet is sent and we raise ValueError.
+       The device will then play what it got after 18 seconds.
+       The device may still be reading its receive buffer. Closing right away would reset
+       the connection and the rest would be lost. So we half close and read the acks until
+       the device closes its side. TimeoutError if it is silent for timeout seconds before.
+    """
+    c0 = time.thread_time()
+    try:
+      if self.sender.bytes != self.size:
+        raise ValueError("%s: %d bytes written, %d announced" % (self.name, self.sender.bytes, self.size))
+      pad = self.sender.close()
+      self.sock.sendall(end_packet)
+      self.sock.shutdown(socket.SHUT_WR)
+      while not self.pacer.eof:
+        if self.pacer.wait_reply(self.timeout) is None and not self.pacer.eof:
+          raise TimeoutError("%s: the device did not confirm the end of the upload within %.1f sec, "
+                             "it may have lost data" % (self.name, self.timeout))
+    finally:
+      self.sock.close()
+      self.cpu += time.thread_time() - c0
+    return pad
+
+  def stats(self):
+    return "%s, cpu %.1f ms/MB" % (self.pacer.stats(), 1e3 * self.cpu / max(1e-6, self.size / 1e6))
+
+
+class StreamUpload(Upload):
+  """
+     An Upload that is a write-only file object, e.g. for bin_file.BinWriter.
+     write() only queues the buffer, a thread sends it. So the producer, e.g. the
+     encoder, keeps working while the data goes out. At most depth buffers wait in
+     the queue. Do not modify a buffer after writing it.
+  """
+  def __init__(self, *args, depth=8, **kwargs):
+    Upload.__init__(self, *args, **kwargs)
+    self.queue = queue.Queue(depth)
+    self.error = None
+    self.thread = threading.Thread(target=self.run, daemon=True)
+    self.thread.start()
+
+  def run(self):
+    while True:
+      buf = self.queue.get()
+      if buf is None:
+        return
+      if self.error is None:
+        try:
+          Upload.write(self, buf)
+        except Exception as e:
+          self.error = e                        # keep draining, so that write() does not block
+
+  def write(self, buf):
+    if self.error:
+      raise self.error
+    self.queue.put(buf)
+    return memoryview(buf).nbytes
+
+  def writelines(self, bufs):
+    for buf in bufs:
+      self.write(buf)
+
+  def flush(self):
+    pass
+
+  def close(self):
+    self.queue.put(None)
+    self.thread.join()
+    if self.error:
+      self.sock.close()
+      raise self.error
+    return Upload.close(self)
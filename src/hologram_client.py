@@ -0,0 +1,175 @@
+#! /usr/bin/python3
+#
+# hologram_client.py -- a session with the propeller display, for use from other scripts.
+#
+# HologramClient keeps the control connection to port 5233 open between commands and
+# connects again when the device has dropped it. Every command returns the parsed
+# listing, a holo_proto.Status, instead of printing. Uploads go over their own
+# connection to port 5499, see holo_upload.py.
+#
+# pause, play and status are sent again on a fresh connection if the first attempt
+# fails. delete is not: if the reply got lost we cannot tell whether the file is gone,
+# and sending it again could remove the next one.
+#
+# Example:
+#   with HologramClient('192.168.4.1') as c:
+#     c.pause()
+#     print(c.status().files)
+#     for line, result in c.run(['upload walk.bin', 'play']):
+#       print(line, result)
+#
+
+import os, time, mmap, shlex, socket, collections
+from holo_proto import Reader, parse_status, command, CMD_PAUSE, CMD_PLAY, CMD_STATUS, CMD_DELETE
+from holo_upload import Upload, chunksize, check_name
+import playlist_sync
+
+Uploaded = collections.namedtuple('Uploaded', 'name size padding seconds stats')
+
+
+class HologramClient:
+  """
+     address, port and upport of the device. timeout is the upper bound for connects and
+     replies in seconds, retries the number of extra attempts for idempotent commands.
+     min_rate and max_rate bound the upload rate in bytes per second.
+     progress is the default for upload().
+  """
+  def __init__(self, address='192.168.4.1', port=5233, upport=5499, timeout=3.0, retries=1,
+               min_rate=47e3, max_rate=1e6, progress=None, verbose=False):
+    self.address = address
+    self.port = int(port)
+    self.upport = int(upport)
+    self.timeout = timeout
+    self.retries = retries
+    self.min_rate = min_rate
+    self.max_rate = max_rate
+    self.progress = progress
+    self.verbose = verbose
+    self.s = None
+    self.reader = None
+    self.connects = 0
+
+  def connect(self):
+    self.disconnect()
+    self.s = socket.create_connection((self.address, self.port), self.timeout)
+    self.reader = Reader(self.s)
+    self.connects += 1
+
+  def disconnect(self):
+    if self.s:
+      self.s.close()
+    self.s = None
+    self.reader = None
+
+  close = disconnect
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def request(self, msg, idempotent=True):
+    """ Send one command message, return the reply as bytes. """
+    for attempt in range(self.retries + 1 if idempotent else 1):
+      if self.s:
+        for stale in self.reader.drain():     # replies we did not wait for
+          if self.verbose:
+            print("stale reply %s" % stale)
+        if self.reader.eof:
+          self.disconnect()
+      try:
+        if not self.s:
+          self.connect()
+        self.s.sendall(msg)
+        reply = self.reader.read(self.timeout)
+        if reply is None:
+          raise TimeoutError("no reply from %s:%d within %.1f sec" % (self.address, self.port, self.timeout))
+        if self.verbose:
+          print("received %s" % reply)
+        return reply
+      except OSError:
+        self.disconnect()
+        if attempt == self.retries or not idempotent:
+          raise
+
+  def pause(self):
+    return parse_status(self.request(command(CMD_PAUSE)))
+
+  def play(self):
+    return parse_status(self.request(command(CMD_PLAY)))
+
+  def status(self):
+    return parse_status(self.request(command(CMD_STATUS)))
+
+  def delete(self, idx):
+    """ idx is the index from status().files. The files after it move up. """
+    if idx <= 0 or idx > 99:
+      raise ValueError("delete index must be between 1 and 99, not %d" % idx)
+    return parse_status(self.request(command(CMD_DELETE, idx), idempotent=False))
+
+  def upload(self, path, name=None, progress=None):
+    """
+       Upload a .bin file, as name or under its own basename. progress(done, size, rate)
+       is called every 64 packets. Returns an Uploaded.
+    """
+    name = name or os.path.basename(path)
+    progress = progress or self.progress
+    check_name(name)
+    size = os.stat(path).st_size
+    if size == 0:
+      raise ValueError("%s is empty" % path)
+    t0 = time.monotonic()
+    up = Upload(self.address, name, size, self.upport, self.min_rate, self.max_rate, self.verbose, self.timeout)
+    step = 64 * chunksize
+    try:
+      with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        data = memoryview(mm)
+        try:
+          for off in range(0, size, step):
+            up.write(data[off:off+step])      # a fixed delay of 0.02 was not enough. we saw spikes.
+            if progress:
+              progress(min(size, off+step), size, up.pacer.rate)
+        finally:
+          data.release()
+    except BaseException:
+      up.sock.close()
+      raise
+    pad = up.close()
+    return Uploaded(name, size, pad, time.monotonic() - t0, up.stats())
+
+  def sync(self, dirname, delete=False, force=False):
+    """
+       Upload the .bin files of dirname that the device does not have or that changed,
+       see playlist_sync.py. delete also removes files that are not in dirname,
+       force uploads the files that we did not upload ourselves. Returns a Synced.
+    """
+    return playlist_sync.sync(self, dirname, delete, force, print if self.verbose else None)
+
+  def do(self, cmd, *args):
+    """ One command with its arguments as words, like on the led-hologram.py command line. """
+    if cmd in ('pause', 'play', 'status') and not args:
+      return getattr(self, cmd)()
+    if cmd in ('del', 'delete') and len(args) == 1:
+      return self.delete(int(args[0]))
+    if cmd == 'upload' and len(args) in (1, 2):
+      return self.upload(*args)
+    if cmd == 'sync' and args and set(args[1:]) <= {'--delete', '--force'}:
+      return self.sync(args[0], '--delete' in args[1:], '--force' in args[1:])
+    if cmd == 'sleep' and len(args) == 1:
+      time.sleep(float(args[0]))
+      return None
+    raise ValueError("unknown command or wrong arguments: %s" % ' '.join((cmd,) + args))
+
+  def run(self, script):
+    """
+       Generator, runs a batch of commands over this session and yields (line, result)
+       for each. script is a sequence of lines like 'pause', 'status', 'delete 3',
+       'upload FILE.bin [NAME.bin]', 'sync DIR [--delete]' or 'sleep 1.5'.
+       Words are split with shlex, text after # is a comment. Quote names that
+       contain blanks or #.
+    """
+    for line in script:
+      words = shlex.split(line, comments=True)
+      if words:
+        yield (line.strip(), self.do(*words))
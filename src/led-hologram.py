@@ -19,25 +19,30 @@
 # v0.1, 2020-01-21, jw  initial draught. Simple pause, play, and status commands done.
 # v0.2, 2020-01-22, jw  delete command added.
 # v0.3, 2020-01-23, jw  upload command added.
+# v0.4, 2026-10-18,     adaptive upload rate instead of a fixed delay, see upload_pacer.py
+#                       packets assembled in one reusable buffer from the mmapped file, see holo_upload.py
+#                       upload via holo_upload.Upload, also used by encode_polar_bin.py --upload
+#                       replies read as complete messages instead of fixed timeouts, see holo_proto.py
+#                       all commands via hologram_client.HologramClient. Option --script for batches.
+#                       sync command, uploads only what the device is missing, see playlist_sync.py
 #
 
 from __future__ import print_function
-import sys, os, math, socket, time, argparse
+import sys, argparse
+from holo_upload import PACKET_SIZE
+from holo_proto import Status
+from hologram_client import HologramClient, Uploaded
+from playlist_sync import Synced
 
 
-__version = "0.3"
+__version = "0.4"
 
 default_ip_addr    = '192.168.4.1'
 default_tcp_port   = '5233'
 default_tcp_upport = '5499'
-default_updelay    = '0.03'
-
-PACKET_SIZE      = 1460
-PACKET_HEADER    = b'd3e0c9ba02014dd8'
-PACKET_TYPE_NAME = b'0AgQ'
-PACKET_TYPE_DATA = b'1GnH'
-PACKET_TYPE_END  = b'1AfF'
-PACKET_TRAILER   = b'bfb5d2a2'
+default_min_rate   = '47'        # KB/s, what the fixed delay of 0.03 sec gave us.
+default_max_rate   = '1000'      # KB/s
+reply_timeout      = 3.0         # seconds, we return as soon as the reply is complete
 
 parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description='Control a 224 LED holographic propeller display.\nVersion %s from https://github.com/jnweiger/led-hologram-propeller\n -- see there for more examples and for updates.' % __version, epilog="""
 Commands:
@@ -56,180 +61,96 @@ Commands:
     Remove a file from the list.
     NN should be an index number from the first column of the status output.
 
-  upload FILE.bin
+  upload FILE.bin [NAME.bin]
     Load a file into the device. The '.bin' suffix is mandatory.
 
+  sync DIR [--delete] [--force]
+    Upload the .bin files of DIR that are missing on the device or changed since
+    the last sync. --delete also removes the files that are not in DIR,
+    --force uploads the files found on the device that sync did not upload.
+
+  sleep SEC
+    Wait, e.g. between commands of a script.
+
+With --script, each line of FILE is one command, all sent over the same connection.
 """)
 
 parser.add_argument('-a', '--address', default=default_ip_addr, help="IP-Addess of the device. Default: %s" % default_ip_addr)
 parser.add_argument('-p', '--port', default=default_tcp_port, help="TCP port to connect with the device. Default: %s" % default_tcp_port)
 parser.add_argument('-u', '--upload-port', default=default_tcp_upport, help="TCP port for file upload. Default: %s" % default_tcp_upport)
-parser.add_argument('-d', '--delay', default=default_updelay, help="Upload delay between writes in seconds. Default %s" % default_updelay)
-parser.add_argument('cmd', metavar='COMMAND', nargs='+', help="Command word.")
+parser.add_argument('-d', '--delay', type=float, help="Fixed upload delay between writes in seconds, e.g. 0.03. Default: adaptive rate")
+parser.add_argument('--min-rate', default=default_min_rate, type=float, help="Upload rate floor in KB/s. Default: %s" % default_min_rate)
+parser.add_argument('--max-rate', default=default_max_rate, type=float, help="Upload rate ceiling in KB/s. Default: %s" % default_max_rate)
+parser.add_argument('-v', '--verbose', action='store_true', help="Report replies and rate changes during upload.")
+parser.add_argument('-s', '--script', metavar='FILE', help="Run the commands in FILE, one per line, '-' for stdin.")
+parser.add_argument('--delete', action='store_true', help="With sync: also delete the files on the device that are not in DIR.")
+parser.add_argument('--force', action='store_true', help="With sync: also upload the files that sync did not upload before.")
+parser.add_argument('cmd', metavar='COMMAND', nargs='*', help="Command word.")
 parser.add_argument('--command-help', action='version', help=argparse.SUPPRESS, version="--")
 args = parser.parse_args()
 # print(args)
 
-def try_recv(s, timeout=0.2, verbose=False):
-  s.settimeout(timeout)       # seconds
-  buf = ''
-  try:
-    buf = s.recv(1024)
-    if buf and verbose:
-      print("received %s" % buf)
-  except socket.timeout:
-    pass
-  s.settimeout(None)               # blocking
-  return buf
-
-
-def fmt_status(msg):
+def fmt_status(st):
   """
   pause received b'c0eeb7c9baa3020000000012cc38lnt200100_green_earth.bin200201_green_earth.bin220302_spinning_coin.bin220403_spinning_coin.bin230504_bouncing_fraph.bin230605_spinning_heart.bin02HE10bfb5d2a2'
   play  received b'c0eeb7c9baa3020000000012cc38lnt200100_green_earth.bin200201_green_earth.bin220302_spinning_coin.bin220403_spinning_coin.bin230504_bouncing_fraph.bin230605_spinning_heart.bin02HE11bfb5d2a2'
   play  received b'c0eeb7c9baa3020000000012cc38lnt200100_green_earth.bin200201_green_earth.bin220302_spinning_coin.bin220403_spinning_coin.bin230504_bouncing_fraph.bin230605_spinning_heart.bin04HE11bfb5d2a2'
-  play  received b'c0eeb7c9baa3020000000012cc38lnt200100_green_earth.bin200201_green_earth.bin220302_spinning_coin.bin220403_spinning_coin.bin230504_bouncing_fraph.bin230605_spinning_heart.bin05HE11bfb5d2a2'
-  play  received b'c0eeb7c9baa3020000000012cc38lnt200100_green_earth.bin200201_green_earth.bin220302_spinning_coin.bin220403_spinning_coin.bin230504_bouncing_fraph.bin230605_spinning_heart.bin06HE11bfb5d2a2'
+
+  st is the holo_proto.Status parsed from such a message.
   """
-  trailer = msg[-14:]   # 02HE10bfb5d2a2
-  if trailer[2:4] != b'HE':
-    print("ERROR: trailer mismatch. did it change size? Trailer: %s" % trailer)
-    sys.exit(1)
-
-  # never fetch a single element from a bytes array! b'1' becomes 49 then. Nice, but not useful here.
-  if trailer[5:6] == b'1':
-    marker = '>>'   # playing
-  elif trailer[5:6] == b'0':
-    marker = '||'   # paused
+  marker = { True: '>>', False: '||', None: '??' }[st.playing]
+  for i, name in st.files:
+    print("%2s %02d| %s" % (marker if i == st.current else '', i, name))
+
+
+def progress(done, size, rate):
+  print(" %6.1f%%  %7.1f KB/s\r" % (100. * done / size, rate / 1e3), end='')
+
+
+min_rate = args.min_rate * 1e3
+max_rate = args.max_rate * 1e3
+if args.delay:
+  min_rate = max_rate = PACKET_SIZE / args.delay
+client = HologramClient(args.address, args.port, args.upload_port, min_rate=min_rate, max_rate=max_rate,
+                        progress=progress, verbose=args.verbose)
+
+if args.script == '-':
+  script = sys.stdin
+elif args.script:
+  script = open(args.script)
+elif not args.cmd:
+  parser.error("need a COMMAND or --script")
+
+try:
+  if args.script:
+    results = client.run(script)
   else:
-    marker = '?' + trailer[5:6].decode('UTF-8')   # unknown flag
-  prefix = msg[0:31]
-  l = msg[31:]
-  li = {}
-  while True:
-    try:
-      n = int(l[0:2])
-    except:
-      break
-    if l[2:4] == b'HE':         # trailer found
-      break
-    li[l[2:4].decode('UTF-8')] = l[4:2+n].decode('UTF-8')
-    l = l[2+n:]
-  for i in sorted(li.keys()):
-    if trailer[:2].decode('UTF-8') == i:
-      print("%2s %2s| %s" % (marker, i, li[i]))
-    else:
-      print("   %2s| %s" % (i, li[i]))
-
-
-def upload_bin_file(address, port, file, delay=float(args.delay)):
-  print("upload_bin_file('%s', %d, '%s', %f)" % (address, port, file, delay))
-
-  u = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-  u.settimeout(3)               # seconds
-  u.connect((address, int(port)))
-  try_recv(u, 0.1, False)
-
-  fname = file.split('/')[-1]
-  fname_b = bytes(fname, 'UTF-8')
-  if fname[-4:] != '.bin':
-    print("upload_file: ERROR: need a filename with '.bin' suffix. Got: '%s'" % fname)
-    sys.exit(1)
-  if len(fname_b) > 99:
-    print("upload_file: ERROR: filename '%s' is %d bytes long. Maximum: 99" %(fname, len(fname_b)))
-    sys.exit(1)
-
-  fsize = os.stat(file).st_size
-  chunksize = PACKET_SIZE - len(PACKET_HEADER) - len(PACKET_TYPE_DATA) - len(PACKET_TRAILER)
-  npackets = math.ceil(float(fsize)/chunksize)
-  padsize = (npackets * chunksize) - fsize
-  print("fsize=%d, chunksize=%d, npackets=%d, padsize=%d" % (fsize, chunksize, npackets, padsize))
-
-  # d3e0c9ba02014dd80AgQ.F.(02_spinning_coin.binbfb5d2a2
-  # b'd3e0c9ba02014dd80AgQ\x00F\x13(02_spinning_coin.binbfb5d2a2'
-  ll = fsize + padsize          # fools! Why do you include the padding here?
-  # fools! Why is the length of the name not here?
-  msg = PACKET_HEADER + PACKET_TYPE_NAME + bytes([(ll>>24)&0xff, (ll>>16)&0xff, (ll>>8)&0xff, ll&0xff]) + fname_b + PACKET_TRAILER
-  # print(msg)
-  n = u.send(msg)
-  try_recv(u, 0.1, True)
-
-  fd = open(file, 'rb')
-  for pkt in range(npackets):
-    buf = fd.read(chunksize)
-    blen = len(buf)
-    if blen < chunksize:
-      print("last packet=%d, padding needed=%d" % (pkt+1, chunksize-blen))
-      if pkt+1 != npackets:
-        print("ERROR: not the last packet, expected %d." % npackets)
-        sys.exit(1)
-      if chunksize-blen != padsize:
-        print("ERROR: size mismatch, expected padding %d." % padsize)
-        sys.exit(1)
-      buf += b'0' * padsize       # fools! Don't you know the difference between "0" and "\0" ?
-    msg = PACKET_HEADER + PACKET_TYPE_DATA + buf + PACKET_TRAILER
-    print(" %6.1f%%\r" % (100. * (pkt+1) / npackets), end='')
-    n = u.send(msg)
-    time.sleep(delay)            # 0.02 is not enough. we see spikes.
-    #u.settimeout(0.1)
-    #if True:
-    #  try:
-    #    r = u.recv(1024)
-    #  except:
-    #    pass
-    #u.settimeout(None)
-
-  try_recv(u, 0.2, True)
-  msg = PACKET_HEADER + PACKET_TYPE_END + PACKET_TRAILER
-  # print(msg)
-  n = u.send(msg)
-  try_recv(u, 0.2, True)
-
-  u.shutdown(socket.SHUT_RDWR)
-  u.close()
-
-
-
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-s.settimeout(3.0)       # seconds
-s.connect((args.address, int(args.port)))
-try_recv(s, 0.1, True)
-
-if args.cmd[0] == 'pause':
-  n = s.send(b"c0eeb7c9baa3020000000014cc" + b"34" + b"lfhbfb5d2a2")
-  print("%d bytes sent." % n)
-
-elif args.cmd[0] == 'play':
-  n = s.send(b"c0eeb7c9baa3020000000014cc" + b"35" + b"lfhbfb5d2a2")
-  print("%d bytes sent." % n)
-
-elif args.cmd[0] == 'status':
-  n = s.send(b"c0eeb7c9baa3020000000014cc" + b"38" + b"lfhbfb5d2a2")
-  fmt_status(try_recv(s, 2.0, False))
-
-elif args.cmd[0] == 'del' or args.cmd[0] == 'delete':
-  if len(args.cmd) < 2:
-    print("ERROR: delete needs an INDEX parameter.")
-    sys.exit(1)
-  idx = int(args.cmd[1])
-  if idx <= 0 or idx > 99:
-    print("ERROR: delete INDEX must be > 1 and < 100. (%d seen)" % idx)
-    sys.exit(1)
-  n = s.send(b"c0eeb7c9baa3020000000014cc" + b"39" + b"lfj" + bytes("%02d" % idx, "UTF-8") + b"bfb5d2a2")
-  print("%d bytes sent." % n)
-
-elif args.cmd[0] == 'upload':
-  if len(args.cmd) < 2:
-    print("ERROR: upload needs an binfile parameter.")
-    sys.exit(1)
-  s.shutdown(socket.SHUT_RDWR)
-  upload_bin_file(args.address, int(args.upload_port), args.cmd[1])
-
-else:
-  print("\nUnknown command '%s' -- try %s --help" % (args.cmd[0], sys.argv[0]))
-
-try_recv(s, 0.5, True)
-s.close()
+    # the words as the shell passed them, file names may contain blanks or '#'
+    words = args.cmd + ['--delete'] * args.delete + ['--force'] * args.force
+    results = [(' '.join(words), client.do(*words))]
+  for line, result in results:
+    if args.script:
+      print("# " + line)
+    if isinstance(result, Status):
+      fmt_status(result)
+    elif isinstance(result, Uploaded):
+      print("\n%s: %s, padding=%d" % (result.name, result.stats, result.padding))
+    elif isinstance(result, Synced):
+      if result.uploaded:
+        print()
+      for name in result.deleted:
+        print("deleted  %s" % name)
+      for name in result.uploaded:
+        print("uploaded %s" % name)
+      for name in result.adopted:
+        print("adopted  %s, found on the device" % name)
+      print("%d uploaded, %d deleted, %d unchanged: %.1f MB sent, %.1f MB not sent" % (
+        len(result.uploaded), len(result.deleted), len(result.kept) + len(result.adopted), result.sent / 1e6, result.saved / 1e6))
+except (OSError, ValueError) as e:
+  print("\nERROR: %s -- try %s --help" % (e, sys.argv[0]))
+  sys.exit(1)
+finally:
+  client.close()
 
 
 # magic seen from port 5499:
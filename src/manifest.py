@@ -0,0 +1,51 @@
+#! /usr/bin/python3
+#
+# manifest.py -- sidecar file that remembers where each frame of a .bin came from.
+#
+# FILE.bin.manifest is JSON:
+#   { "params": { ... encoder settings ... },
+#     "frames": [ { "source": "img.png", "hash": "<sha256 of the file>", "offset": 4096, "repeat": 1 }, ... ] }
+#
+# encode_polar_bin.py --update uses it to re-encode only the frames whose source changed.
+# Every other run that writes FILE.bin removes the manifest, it would describe the old frames.
+#
+
+import os, json, hashlib
+
+suffix = '.manifest'
+
+
+def file_hash(path):
+  h = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(1<<20), b''):
+      h.update(chunk)
+  return h.hexdigest()
+
+
+def manifest_path(binfile):
+  return binfile + suffix
+
+
+def load_manifest(binfile):
+  """ Returns the manifest as dict, or None if there is none or it cannot be read. """
+  try:
+    with open(manifest_path(binfile)) as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return None
+
+
+def save_manifest(binfile, manifest):
+  tmp = manifest_path(binfile) + '.tmp'
+  with open(tmp, 'w') as f:
+    json.dump(manifest, f, indent=1)
+  os.replace(tmp, manifest_path(binfile))
+
+
+def remove_manifest(binfile):
+  """ The .bin is rewritten, its manifest no longer describes it. """
+  try:
+    os.unlink(manifest_path(binfile))
+  except FileNotFoundError:
+    pass
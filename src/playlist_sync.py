@@ -0,0 +1,132 @@
+#! /usr/bin/python3
+#
+# playlist_sync.py -- make the playlist on the device match a directory of .bin files.
+#
+# The device lists names only, no sizes, no checksums. So we remember what we uploaded:
+# DIR/.synced-ADDRESS-PORT.json maps each name to the size and hash of the local file
+# at the time of its upload. A local .bin is uploaded when
+#
+#  - its name is not on the device (missing), or
+#  - size or hash differ from what we uploaded under that name (changed). The old copies
+#    are deleted first, the device would list the name twice.
+#
+# The hash is that of FILE.bin.manifest, see manifest.py, if it is not older than the
+# .bin. That is much cheaper than hashing the .bin and changes with every re-encode.
+# Without manifest, the .bin itself is hashed.
+#
+# A name that is on the device but not in the state file is adopted as it is: we
+# cannot tell, and uploading the whole playlist again is what we want to avoid.
+# Use force to upload it anyway. Files on the device without a local .bin are extra,
+# they are deleted only when asked for, like duplicate copies of a name that is up to date.
+#
+# Uploads go smallest first: the most files are right soonest, and an interrupted
+# sync has done the most. The state file is saved after each upload.
+# The device appends uploads to its list, sync does not restore the local order.
+#
+
+import os, json, collections
+from manifest import file_hash, manifest_path
+
+SyncPlan = collections.namedtuple('SyncPlan', 'uploads deletes kept adopted extra')
+Synced = collections.namedtuple('Synced', 'uploaded deleted kept adopted sent saved')
+
+
+def state_path(dirname, address, port):
+  return os.path.join(dirname, '.synced-%s-%d.json' % (address, int(port)))
+
+
+def load_state(path):
+  """ { name: { "size": N, "hash": "..." } } of what we uploaded, empty if there is none. """
+  try:
+    with open(path) as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return {}
+
+
+def save_state(path, state):
+  tmp = path + '.tmp'
+  with open(tmp, 'w') as f:
+    json.dump(state, f, indent=1, sort_keys=True)
+  os.replace(tmp, path)
+
+
+def content_hash(binfile):
+  """ sha256 of the manifest, if it is up to date, else of the .bin itself """
+  try:
+    if os.stat(manifest_path(binfile)).st_mtime >= os.stat(binfile).st_mtime:
+      return 'manifest:' + file_hash(manifest_path(binfile))
+  except OSError:
+    pass
+  return file_hash(binfile)
+
+
+def local_files(dirname):
+  """ { name: { "path": ..., "size": N, "hash": "..." } } of the .bin files in dirname """
+  files = {}
+  for name in sorted(os.listdir(dirname)):
+    path = os.path.join(dirname, name)
+    if name.endswith('.bin') and os.path.isfile(path):
+      files[name] = { 'path': path, 'size': os.stat(path).st_size, 'hash': content_hash(path) }
+  return files
+
+
+def plan_sync(status, local, state, delete=False, force=False):
+  """
+     status is the holo_proto.Status of the device, local from local_files(), state from
+     load_state(). Returns a SyncPlan: uploads and kept are lists of local names, uploads
+     ordered smallest first, deletes the device names to remove, one entry per copy.
+  """
+  on_device = collections.Counter(name for i, name in status.files)
+  uploads, deletes, kept, adopted = [], [], [], []
+  for name, f in local.items():
+    n = on_device.get(name, 0)
+    if n:
+      known = state.get(name)
+      if force or known is not None and (known['size'], known['hash']) != (f['size'], f['hash']):
+        deletes += [name] * n                 # changed, all copies are outdated
+      else:
+        (kept if known else adopted).append(name)
+        if delete:
+          deletes += [name] * (n - 1)         # duplicates from an earlier upload
+        continue
+    uploads.append(name)
+  extra = sorted(set(on_device) - set(local))
+  if delete:
+    deletes += [name for name in extra for i in range(on_device[name])]
+  uploads.sort(key=lambda name: local[name]['size'])
+  return SyncPlan(uploads, deletes, kept, adopted, extra)
+
+
+def sync(client, dirname, delete=False, force=False, log=None):
+  """
+     Make the playlist of the device behind client, a HologramClient, match dirname.
+     log(msg) is called before each step. Returns a Synced.
+  """
+  local = local_files(dirname)
+  path = state_path(dirname, client.address, client.port)
+  state = load_state(path)
+  status = client.status()
+  plan = plan_sync(status, local, state, delete, force)
+  for name in plan.adopted:
+    state[name] = { 'size': local[name]['size'], 'hash': local[name]['hash'] }
+  save_state(path, state)
+  for name in plan.deletes:
+    idx = max(i for i, n in status.files if n == name)    # the last copy, the first one keeps playing longest
+    if log:
+      log("delete %02d %s" % (idx, name))
+    status = client.delete(idx)
+    if name not in local:
+      state.pop(name, None)
+  sent = 0
+  for name in plan.uploads:
+    f = local[name]
+    if log:
+      log("upload %s, %d bytes" % (name, f['size']))
+    client.upload(f['path'], name)
+    state[name] = { 'size': f['size'], 'hash': f['hash'] }
+    save_state(path, state)
+    sent += f['size']
+  save_state(path, state)
+  saved = sum(local[name]['size'] for name in plan.kept + plan.adopted)
+  return Synced(plan.uploads, plan.deletes, plan.kept, plan.adopted, sent, saved)
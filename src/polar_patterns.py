@@ -0,0 +1,199 @@
+#! /usr/bin/python3
+#
+# polar_patterns.py -- test patterns drawn directly in (ray, ring) space.
+#
+# The generators in test/ paint Cartesian images pixel by pixel, then the encoder
+# resamples them into rays. Rings, sectors and sweeps are much simpler in polar
+# coordinates, see polar_bin_test(). Here each pattern is a numpy array of shape
+# (n_rays, rings, 3), built with broadcasting from two axes:
+#
+#   ray_deg   angle of each ray in degrees, counter clockwise from 3 o'clock, as the
+#             encoder maps the source image (ray n is at 360*n/n_rays)
+#   ring_idx  0 at the hub, rings-1 at the tip of the blade
+#
+# Colors are 0..255 per channel. Only the ordered dither runs, no rasterization and
+# no resampling: pure colors come out as they are, levels in between are dithered.
+# Each pattern becomes a bin_file.Animation and is written as NAME.bin.
+#
+# Usage:
+#  $0 [-o DIR] [--hold SEC] [NAME ...]        all patterns if no NAME is given
+#  $0 --list
+#
+# 2026-10-18, v0.1 -- initial draft.
+#
+
+import os, sys, time, argparse
+import numpy as np
+from bin_file import Frame, Animation, n_rays, fps
+from dither import dither_frame
+
+leds     = 224
+rings    = leds // 2
+ray_deg  = 360. * np.arange(n_rays) / n_rays
+ring_idx = np.arange(rings)
+
+BLACK, WHITE = (0, 0, 0), (255, 255, 255)
+RED, GREEN, BLUE = (255, 0, 0), (0, 255, 0), (0, 0, 255)
+YELLOW, CYAN, MAGENTA = (255, 255, 0), (0, 255, 255), (255, 0, 255)
+primaries = [RED, GREEN, BLUE, YELLOW, CYAN, MAGENTA, WHITE]
+
+
+## masks of shape (n_rays, rings), or broadcastable to it
+
+def angle_mask(start, width):
+  """ Rays from start to start+width degrees, counter clockwise. Shape (n_rays, 1) """
+  return (((ray_deg - start) % 360.) < width)[:, np.newaxis]
+
+
+def ring_mask(first, count=1):
+  """ count rings from first outwards. Shape (1, rings) """
+  return ((ring_idx >= first) & (ring_idx < first + count))[np.newaxis, :]
+
+
+def paint(mask, color, rgb=None):
+  """ Set color where mask is true, on rgb or on a new black canvas. """
+  if rgb is None:
+    rgb = np.zeros((n_rays, rings, 3), dtype=np.uint8)
+  rgb[np.broadcast_to(mask, rgb.shape[:2])] = color
+  return rgb
+
+
+## single frames, as (n_rays, rings, 3) uint8
+
+def solid(color=WHITE):
+  return paint(np.True_, color)
+
+
+def ring_lines(spacing=8, width=1, color=WHITE):
+  """ Concentric circles every spacing rings, the outermost ring is always lit. """
+  return paint(((ring_idx % spacing < width) | (ring_idx == rings-1))[np.newaxis, :], color)
+
+
+def sectors(colors=primaries):
+  """ The circle divided into len(colors) equal sectors, the first one starts at 3 o'clock. """
+  idx = (ray_deg * len(colors) // 360.).astype(np.intp)
+  return np.ascontiguousarray(np.broadcast_to(np.array(colors, dtype=np.uint8)[idx][:, np.newaxis, :], (n_rays, rings, 3)))
+
+
+def spokes(n=12, width=1., color=WHITE):
+  """ n radial lines of width degrees, the first one at 3 o'clock. """
+  return paint(((ray_deg + width/2.) % (360. / n) < width)[:, np.newaxis], color)
+
+
+def color_bars(colors=primaries):
+  """ Concentric bands of equal width, the first color at the hub. """
+  idx = ring_idx * len(colors) // rings
+  return np.ascontiguousarray(np.broadcast_to(np.array(colors, dtype=np.uint8)[idx][np.newaxis, :, :], (n_rays, rings, 3)))
+
+
+def ring_ramp(color=WHITE):
+  """ Brightness from 0 at the hub to color at the tip, in 4 sectors for R, G, B and color. """
+  level = ring_idx / (rings - 1.)
+  rgb = np.zeros((n_rays, rings, 3), dtype=np.uint8)
+  for i, c in enumerate([RED, GREEN, BLUE, color]):
+    rgb[(ray_deg // 90.) == i] = (level[:, np.newaxis] * np.array(c) + 0.5).astype(np.uint8)
+  return rgb
+
+
+def beam(angle, width=6., color=GREEN, trail=90.):
+  """ A radar beam at angle, with a trail that fades over trail degrees behind it (clockwise sweep). """
+  behind = (ray_deg - angle) % 360.            # a clockwise beam leaves its trail counter clockwise
+  level = np.where(behind < width, 1., np.clip(1. - (behind - width) / max(trail, 1e-6), 0., 1.) * 0.6)
+  level[behind >= width + trail] = 0.
+  return np.ascontiguousarray(np.broadcast_to((level[:, np.newaxis] * np.array(color) + 0.5).astype(np.uint8)[:, np.newaxis, :], (n_rays, rings, 3)))
+
+
+def to_frame(rgb, dither='ordered'):
+  return Frame.from_bits(dither_frame(rgb, dither))
+
+
+## animations
+
+def still(rgb, hold=3.):
+  """ One frame shown for hold seconds """
+  anim = Animation()
+  anim.append(to_frame(rgb), max(1, round(hold * fps)))
+  return anim
+
+
+def sweep(frames=36, width=6., color=GREEN, trail=90.):
+  """ A radar beam, one clockwise turn in frames steps """
+  return Animation(to_frame(beam(-360. * i / frames, width, color, trail)) for i in range(frames))
+
+
+def flicker(colors=(WHITE, YELLOW, CYAN, MAGENTA), repeat=1, cycles=10):
+  """ Solid colors in turn, each for repeat frames. Like test/white_yellow_cyan.py """
+  encoded = [to_frame(solid(c)) for c in colors]
+  anim = Animation()
+  for i in range(cycles):
+    for f in encoded:
+      anim.append(f, repeat)
+  return anim
+
+
+def quad_flicker(color=YELLOW, repeat=1, cycles=10):
+  """ One lit quadrant, moving clockwise from the top left. Like test/flicker_quad_cw.py """
+  encoded = [to_frame(paint(angle_mask(start, 90.), color)) for start in (90., 0., 270., 180.)]
+  anim = Animation()
+  for i in range(cycles):
+    for f in encoded:
+      anim.append(f, repeat)
+  return anim
+
+
+def walking_ring(width=2, step=2, color=WHITE):
+  """ A ring moving from the hub to the tip and back. The polar cousin of test/walking_bar.py """
+  firsts = list(range(0, rings - width + 1, step))
+  firsts += firsts[-2:0:-1]
+  return Animation(to_frame(paint(ring_mask(first, width), color)) for first in firsts)
+
+
+def sector_walk(n=8, repeat=3, color=WHITE):
+  """ One sector of 360/n degrees lit at a time, counter clockwise. Shows the ray order. """
+  anim = Animation()
+  for i in range(n):
+    anim.append(to_frame(paint(angle_mask(i * 360. / n, 360. / n), color)), repeat)
+  return anim
+
+
+patterns = {
+  'rings':        lambda hold: still(ring_lines(), hold),
+  'spokes':       lambda hold: still(spokes(), hold),
+  'sectors':      lambda hold: still(sectors(), hold),
+  'color_bars':   lambda hold: still(color_bars(), hold),
+  'ring_ramp':    lambda hold: still(ring_ramp(), hold),
+  'white':        lambda hold: still(solid(WHITE), hold),
+  'radar':        lambda hold: sweep(),
+  'flicker':      lambda hold: flicker(),
+  'quad_flicker': lambda hold: quad_flicker(),
+  'walking_ring': lambda hold: walking_ring(),
+  'sector_walk':  lambda hold: sector_walk(),
+}
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Write test patterns as .bin files for the 224 LED holographic propeller display.')
+  parser.add_argument('-o', '--outdir', default='.', help="Directory for the NAME.bin files. Default: .")
+  parser.add_argument('--hold', default=3., type=float, help="Seconds to show a still pattern. Default: 3")
+  parser.add_argument('-l', '--list', action='store_true', help="List the patterns.")
+  parser.add_argument('names', metavar='NAME', nargs='*', help="Patterns to write. Default: all")
+  args = parser.parse_args()
+
+  if args.list:
+    for name in patterns:
+      print(name)
+    sys.exit(0)
+  for name in args.names:
+    if name not in patterns:
+      parser.error("unknown pattern '%s', see --list" % name)
+  try:
+    os.makedirs(args.outdir, exist_ok=True)
+  except OSError as e:
+    parser.error("-o: %s" % e)
+  t0 = time.monotonic()
+  for name in args.names or patterns:
+    anim = patterns[name](args.hold)
+    path = os.path.join(args.outdir, name + '.bin')
+    anim.write(path)
+    print("%-30s %4d frames, %4.1f sec" % (path, len(anim), anim.duration()))
+  print("%.2f sec" % (time.monotonic() - t0))
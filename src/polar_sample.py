@@ -0,0 +1,251 @@
+#! /usr/bin/python3
+#
+# polar_sample.py -- precomputed polar sampling tables.
+#
+# encode_polar_bin() used to call math.radians(), polar2cart() and quad_avg() for
+# every (ray, led) sample of every frame. The coordinates only depend on the geometry,
+# so we compute the four neighbour indices and the bilinear weights once per
+# (diam, c_x, c_y, n_rays, leds) and then resample a whole frame as one numpy gather.
+#
+# The arithmetic is done in exactly the same order as quad_avg(), so the result is
+# bit for bit identical to the per-pixel code path.
+#
+# AreaSampler is the anti-aliased alternative: a precomputed sparse footprint kernel
+# per sample instead of a single bilinear tap.
+#
+# Both have an inverse index (pixel -> samples) and can resample a subset of samples,
+# for encoding only what changed since the previous frame, see delta_encode.py.
+#
+
+import math
+import functools
+import numpy as np
+
+
+def concat_ranges(start, count):
+  """ np.concatenate([np.arange(a, a+n) for a, n in zip(start, count)]) without the loop """
+  ends = np.cumsum(count)
+  return np.repeat(start - ends + count, count) + np.arange(ends[-1] if len(ends) else 0)
+
+
+class InverseIndex:
+  """
+     Which samples does a source pixel contribute to? Built from the (y, x, sample)
+     triples of all taps, stored CSR style, sorted by pixel.
+  """
+  def __init__(self, ys, xs, rows):
+    self.width = int(xs.max()) + 1
+    self.height = int(ys.max()) + 1
+    key = ys * self.width + xs
+    order = np.argsort(key, kind='stable')
+    self.rows = rows[order]
+    self.indptr = np.searchsorted(key[order], np.arange(self.width*self.height+1))
+
+  def samples(self, ys, xs):
+    """ Sorted unique flat sample indices that depend on any of the pixels (ys[i], xs[i]). """
+    inside = (ys < self.height) & (xs < self.width)
+    k = ys[inside] * self.width + xs[inside]
+    start = self.indptr[k]
+    return np.unique(self.rows[concat_ranges(start, self.indptr[k+1] - start)])
+
+
+class PolarSampler:
+  """
+     A sampling table for one geometry.
+     resample(im) returns an array of shape (n_rays, leds//2, channels), dtype uint8.
+     Ray n is the scan line at phi = radians(360*(n_rays-n)/n_rays), led 0 is at the hub.
+  """
+  d_eps = 0.0001        # same epsilon as in quad_avg()
+
+  def __init__(self, diam, c_x, c_y, n_rays, leds):
+    self.diam = diam
+    self.c_x = c_x
+    self.c_y = c_y
+    self.n_rays = n_rays
+    self.leds = leds
+
+    sca = float(diam-1)/float(leds-1)
+    r = (0.5 + np.arange(leds//2)) * sca
+    # math.cos() and math.sin() on purpose: numpy may use a different libm and
+    # could differ in the last bit from what polar2cart() computes.
+    phi = [math.radians(360.*(n_rays-n)/n_rays) for n in range(n_rays)]
+    cos_phi = np.array([math.cos(p) for p in phi])
+    sin_phi = np.array([math.sin(p) for p in phi])
+    x = c_x + r[np.newaxis,:] * cos_phi[:,np.newaxis]
+    y = c_y + r[np.newaxis,:] * sin_phi[:,np.newaxis]
+    self.x = x
+    self.y = y
+
+    x0 = x.astype(np.intp)      # int() truncates towards zero, so does astype()
+    y0 = y.astype(np.intp)
+    xd = x - x0
+    yd = y - y0
+    # Below the epsilon quad_avg() ignores the neighbour. A weight of exactly 0.
+    # gives the same result, as v*1. + w*0. == v in IEEE arithmetic.
+    x_near = xd <= self.d_eps
+    y_near = yd <= self.d_eps
+    xd[x_near] = 0.
+    yd[y_near] = 0.
+    self.x0 = x0
+    self.y0 = y0
+    self.x1 = np.where(x_near, x0, x0+1)
+    self.y1 = np.where(y_near, y0, y0+1)
+    self.xd  = xd[:,:,np.newaxis]
+    self.yd  = yd[:,:,np.newaxis]
+    self.xd1 = (1-xd)[:,:,np.newaxis]
+    self.yd1 = (1-yd)[:,:,np.newaxis]
+
+  def resample(self, im):
+    """
+       im is a PIL image or a numpy array of shape (height, width, channels).
+       The image must cover the geometry, like with quad_avg() there is no clipping.
+    """
+    pix = np.asarray(im)
+    if pix.ndim == 2:
+      pix = pix[:,:,np.newaxis]
+    y0_avg = pix[self.y0, self.x0] * self.xd1 + pix[self.y0, self.x1] * self.xd
+    y1_avg = pix[self.y1, self.x0] * self.xd1 + pix[self.y1, self.x1] * self.xd
+    return (y0_avg * self.yd1 + y1_avg * self.yd + 0.5).astype(np.uint8)
+
+  def resample_samples(self, im, samples):
+    """
+       Only the given flat sample indices (ray * leds//2 + led), shape (len(samples), channels).
+       Same values as resample(im).reshape(-1, channels)[samples].
+    """
+    pix = np.asarray(im)
+    if pix.ndim == 2:
+      pix = pix[:,:,np.newaxis]
+    y0 = self.y0.ravel()[samples]
+    y1 = self.y1.ravel()[samples]
+    x0 = self.x0.ravel()[samples]
+    x1 = self.x1.ravel()[samples]
+    xd  = self.xd.reshape(-1, 1)[samples]
+    yd  = self.yd.reshape(-1, 1)[samples]
+    xd1 = self.xd1.reshape(-1, 1)[samples]
+    yd1 = self.yd1.reshape(-1, 1)[samples]
+    y0_avg = pix[y0, x0] * xd1 + pix[y0, x1] * xd
+    y1_avg = pix[y1, x0] * xd1 + pix[y1, x1] * xd
+    return (y0_avg * yd1 + y1_avg * yd + 0.5).astype(np.uint8)
+
+  @functools.cached_property
+  def inverse(self):
+    """ InverseIndex of the four taps of each sample """
+    rows = np.arange(self.x0.size)
+    return InverseIndex(np.concatenate([self.y0.ravel(), self.y0.ravel(), self.y1.ravel(), self.y1.ravel()]),
+                        np.concatenate([self.x0.ravel(), self.x1.ravel(), self.x0.ravel(), self.x1.ravel()]),
+                        np.concatenate([rows, rows, rows, rows]))
+
+
+class AreaSampler:
+  """
+     Anti-aliased variant of PolarSampler with the same interface.
+     Each (ray, led) sample averages over its footprint, the annulus sector between
+     the neighbouring rays and LEDs. The footprint is supersampled with about ss
+     points per source pixel in each direction, each point is a bilinear tap.
+     All taps are merged into one sparse matrix (samples x source pixels), stored as
+     coordinate lists, so that resampling a frame is one sparse mat-vec per channel.
+     Near the hub the footprint is below one pixel and this degrades to the bilinear case.
+  """
+  def __init__(self, diam, c_x, c_y, n_rays, leds, ss=2):
+    self.diam = diam
+    self.c_x = c_x
+    self.c_y = c_y
+    self.n_rays = n_rays
+    self.leds = leds
+    self.ss = ss
+    self.flat = {}          # image width -> flat pixel indices
+
+    sca = float(diam-1)/float(leds-1)
+    dphi = 2*math.pi/n_rays
+    phi = np.radians(360.*(n_rays-np.arange(n_rays))/n_rays)
+    n_r = max(1, int(math.ceil(sca * ss)))
+    rows, ys, xs, ws = [], [], [], []
+    for led in range(leds//2):
+      r = (0.5+led) * sca
+      n_a = max(1, int(math.ceil(r * dphi * ss)))
+      # subsample points of this ring, shape (n_rays, n_r * n_a)
+      sub_r = r + sca * ((np.arange(n_r)+0.5)/n_r - 0.5)
+      sub_a = dphi * ((np.arange(n_a)+0.5)/n_a - 0.5)
+      sub_r, sub_a = [a.ravel() for a in np.meshgrid(sub_r, sub_a)]
+      p = phi[:,np.newaxis] + sub_a[np.newaxis,:]
+      x = np.clip(c_x + sub_r * np.cos(p), 0, diam-1)
+      y = np.clip(c_y + sub_r * np.sin(p), 0, diam-1)
+      x0 = np.floor(x)
+      y0 = np.floor(y)
+      xd = x - x0
+      yd = y - y0
+      x0 = x0.astype(np.intp)
+      y0 = y0.astype(np.intp)
+      x1 = np.minimum(x0+1, diam-1)
+      y1 = np.minimum(y0+1, diam-1)
+      w = 1. / (n_r * n_a)
+      row = (np.arange(n_rays) * (leds//2) + led)[:,np.newaxis] + np.zeros_like(x0)
+      for (ty, tx, tw) in ((y0, x0, (1-xd)*(1-yd)), (y0, x1, xd*(1-yd)), (y1, x0, (1-xd)*yd), (y1, x1, xd*yd)):
+        rows.append(row.ravel())
+        ys.append(ty.ravel())
+        xs.append(tx.ravel())
+        ws.append((tw*w).ravel())
+    rows = np.concatenate(rows)
+    ys = np.concatenate(ys)
+    xs = np.concatenate(xs)
+    ws = np.concatenate(ws)
+    # merge duplicate (sample, pixel) entries, sorted by sample.
+    key = (rows * diam + ys) * diam + xs
+    key, inv = np.unique(key, return_inverse=True)
+    self.weights = np.bincount(inv.ravel(), weights=ws)
+    self.x = key % diam
+    self.y = key // diam % diam
+    self.rows = key // (diam*diam)
+    self.rowptr = np.searchsorted(self.rows, np.arange(n_rays*(leds//2)+1))
+
+  def resample(self, im):
+    pix = np.asarray(im)
+    if pix.ndim == 2:
+      pix = pix[:,:,np.newaxis]
+    height, width, nchan = pix.shape
+    if width not in self.flat:
+      self.flat[width] = self.y * width + self.x
+    idx = self.flat[width]
+    pix = pix.reshape(height*width, nchan)
+    nsamples = self.n_rays * (self.leds//2)
+    out = np.empty((nsamples, nchan), dtype=np.uint8)
+    for c in range(nchan):
+      v = np.bincount(self.rows, weights=pix[idx, c] * self.weights, minlength=nsamples)
+      out[:,c] = np.minimum(v + 0.5, 255)
+    return out.reshape(self.n_rays, self.leds//2, nchan)
+
+  def resample_samples(self, im, samples):
+    """ Same values as resample(im).reshape(-1, channels)[samples], at the cost of those samples only. """
+    pix = np.asarray(im)
+    if pix.ndim == 2:
+      pix = pix[:,:,np.newaxis]
+    height, width, nchan = pix.shape
+    if width not in self.flat:
+      self.flat[width] = self.y * width + self.x
+    start = self.rowptr[samples]
+    count = self.rowptr[samples+1] - start
+    taps = concat_ranges(start, count)
+    local = np.repeat(np.arange(len(samples)), count)
+    idx = self.flat[width][taps]
+    weights = self.weights[taps]
+    pix = pix.reshape(height*width, nchan)
+    out = np.empty((len(samples), nchan), dtype=np.uint8)
+    for c in range(nchan):
+      v = np.bincount(local, weights=pix[idx, c] * weights, minlength=len(samples))
+      out[:,c] = np.minimum(v + 0.5, 255)
+    return out
+
+  @functools.cached_property
+  def inverse(self):
+    return InverseIndex(self.y, self.x, self.rows)
+
+
+samplers = {
+  'bilinear': PolarSampler,
+  'area':     AreaSampler,
+}
+
+@functools.lru_cache(maxsize=16)
+def get_sampler(diam, c_x, c_y, n_rays, leds, mode='bilinear'):
+  """ Return a cached sampler for this geometry. mode is 'bilinear' (quad_avg() compatible) or 'area'. """
+  return samplers[mode](diam, c_x, c_y, n_rays, leds)
@@ -0,0 +1,101 @@
+#! /usr/bin/python3
+#
+# profiler.py -- per frame, per stage timing for the encoder and other batch tools.
+#
+# Code that does the work wraps each stage in a context:
+#
+#   with prof.stage('dither', imgfile):
+#     bits = dither_frame(rgb)
+#
+# With the default noprof that is a shared nullcontext, nothing is measured or kept,
+# so the hooks can stay in the hot paths. A Profiler records, per stage and frame,
+# the wall time, the cpu time of the calling thread and the peak RSS at the end of
+# the stage, i.e. the stage that raised the peak shows it first.
+#
+# summary() prints a table per stage. write() saves the records in Chrome trace event
+# format, for chrome://tracing or https://ui.perfetto.dev, with the summary in the same
+# JSON. Work done in other processes is recorded there with a Profiler of their own
+# and merged with add(), see encode_polar_bin.encode_files().
+#
+
+import os, sys, json, time, contextlib
+
+try:
+  import resource
+except ImportError:             # not on Windows
+  resource = None
+
+
+def peak_rss():
+  """ Peak resident set size of this process in bytes, 0 where unknown. """
+  if resource is None:
+    return 0
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class NullProfiler:
+  """ Records nothing. """
+  enabled = False
+  frame = None
+  _null = contextlib.nullcontext()
+
+  def stage(self, name, frame=None):
+    return self._null
+
+noprof = NullProfiler()
+
+
+class Profiler:
+  """
+     records is a list of (frame, stage, start, wall, cpu, rss, pid), start is
+     time.perf_counter() in seconds, rss in bytes. frame is used where stage() gets none.
+  """
+  enabled = True
+
+  def __init__(self):
+    self.records = []
+    self.frame = None
+    self.t_start = time.perf_counter()
+
+  @contextlib.contextmanager
+  def stage(self, name, frame=None):
+    t0, c0 = time.perf_counter(), time.thread_time()
+    try:
+      yield
+    finally:
+      self.records.append((self.frame if frame is None else frame, name, t0,
+                           time.perf_counter() - t0, time.thread_time() - c0, peak_rss(), os.getpid()))
+
+  def add(self, records):
+    """ Records of a Profiler in another process """
+    self.records += records
+
+  def stages(self):
+    """ { stage: dict(frames, wall, cpu, max, rss) } in the order the stages first ran. Times in seconds. """
+    res = {}
+    for frame, name, t0, wall, cpu, rss, pid in self.records:
+      s = res.setdefault(name, { 'frames': 0, 'wall': 0., 'cpu': 0., 'max': 0., 'rss': 0 })
+      s['frames'] += 1
+      s['wall'] += wall
+      s['cpu'] += cpu
+      s['max'] = max(s['max'], wall)
+      s['rss'] = max(s['rss'], rss)
+    return res
+
+  def summary(self, file=sys.stdout):
+    elapsed = time.perf_counter() - self.t_start
+    print("%-10s %6s %9s %9s %9s %9s %5s %8s" % ('stage', 'frames', 'wall s', 'ms/frame', 'max ms', 'cpu s', 'wall%', 'peak MB'), file=file)
+    for name, s in self.stages().items():
+      print("%-10s %6d %9.3f %9.2f %9.2f %9.3f %5.1f %8.1f" % (name, s['frames'], s['wall'], 1e3 * s['wall'] / s['frames'],
+            1e3 * s['max'], s['cpu'], 100 * s['wall'] / max(1e-9, elapsed), s['rss'] / 1e6), file=file)
+    print("%.3f sec elapsed, peak RSS %.1f MB" % (elapsed, peak_rss() / 1e6), file=file)
+
+  def write(self, path):
+    events = [{ 'name': name, 'ph': 'X', 'pid': pid, 'tid': pid,
+                'ts': round(1e6 * (t0 - self.t_start), 1), 'dur': round(1e6 * wall, 1),
+                'args': { 'frame': str(frame), 'cpu_ms': round(1e3 * cpu, 3), 'rss_mb': round(rss / 1e6, 1) } }
+              for frame, name, t0, wall, cpu, rss, pid in self.records]
+    with open(path, 'w') as f:
+      json.dump({ 'traceEvents': events, 'displayTimeUnit': 'ms', 'stages': self.stages(),
+                  'elapsed': time.perf_counter() - self.t_start, 'peak_rss': peak_rss() }, f, indent=1)
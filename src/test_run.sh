@@ -1,9 +1,6 @@
 set -x
 
-# python3 encode_polar_bin.py ../test/freecad/four_primitives/t0*.png
-# mv rgb_enc_01.bin four_prim_od.bin
+# python3 encode_polar_bin.py -o four_prim_od.bin ../test/freecad/four_primitives/t0*.png
 
-env HOLO_REP_IMG=30 python3 encode_polar_bin.py ../test/png/arc_*shades.png
-mv rgb_enc_01.bin arc_shades_od.bin
-env HOLO_REP_IMG=30 python3 encode_polar_bin.py ../test/png/circ_grad_*.png
-mv rgb_enc_01.bin circ_colors_od.bin
+env HOLO_REP_IMG=30 python3 encode_polar_bin.py -o arc_shades_od.bin ../test/png/arc_*shades.png
+env HOLO_REP_IMG=30 python3 encode_polar_bin.py -o circ_colors_od.bin ../test/png/circ_grad_*.png
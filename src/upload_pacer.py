@@ -0,0 +1,200 @@
+#! /usr/bin/python3
+#
+# upload_pacer.py -- adaptive pacing for the upload port of the propeller display.
+#
+# led-hologram.py used to sleep a fixed 0.03 sec after each 1460 byte packet. That is
+# about 47 KB/s, no matter how good the WiFi is. Without any delay the device shows
+# spikes. Pacer sends at a rate between a floor and a ceiling and adjusts the rate
+# from what it can observe:
+#
+#  - The send queue of the socket (SIOCOUTQ on Linux: bytes not yet acked by the device).
+#    Where the queue cannot be read, the time spent blocked in sendall() is used instead.
+#    A short queue means the device keeps up, the rate grows by a few percent per packet.
+#    A queue above the high watermark cuts the rate, at most once per backoff interval.
+#  - Replies on the upload port. The device acks the name with 0AfJffff and every 16 data
+#    packets with 1AfJffff, see doc/upload-protocol.txt. Any other code (we have seen
+#    0AfJ0000) is taken as a complaint and halves the rate.
+#  - Stalls. If the queue stays above the high watermark for stall_time seconds, the
+#    rate drops to the floor and we wait until the queue has drained.
+#    The device closes the file and plays it, if nothing arrives for 18 seconds.
+#
+# send() does it all with blocking calls. Under an event loop, the caller awaits delay(),
+# reports each packet with sent() and the received bytes with feed(), see fleet.py.
+#
+
+import time, select, struct
+
+try:
+  import fcntl, termios
+  SIOCOUTQ = termios.TIOCOUTQ     # same ioctl number on Linux
+except (ImportError, AttributeError):
+  fcntl = None
+
+device_timeout = 18.0             # seconds without data, then the device closes the file
+
+
+def send_queue(s):
+  """ Bytes in the send queue of socket s, not yet acknowledged by the peer. None if unknown. """
+  if fcntl is None:
+    return None
+  try:
+    return struct.unpack('i', fcntl.ioctl(s.fileno(), SIOCOUTQ, b'\0\0\0\0'))[0]
+  except OSError:
+    return None
+
+
+class Pacer:
+  """
+     Send packets over socket s at an adaptive rate, in bytes per second.
+     min_rate and max_rate are the floor and ceiling, rate is the start value.
+     low and high are the send queue watermarks in bytes.
+  """
+  grow = 1.03                     # per packet with a short queue
+  shrink = 0.7                    # per backoff because of a long queue
+  backoff_interval = 0.2          # seconds, give a backoff time to take effect
+  block_time = 0.01               # seconds in sendall() that count as a full queue, without SIOCOUTQ
+  max_burst = 0.05                # seconds, do not catch up on time lost more than this
+  blocking = True                 # stall() sleeps until drained. False for an event loop.
+
+  def __init__(self, s, min_rate=47e3, max_rate=1e6, rate=None, low=4*1460, high=16*1460, stall_time=2.0, verbose=False):
+    self.s = s
+    self.min_rate = min_rate
+    self.max_rate = max(min_rate, max_rate)
+    self.rate = min(self.max_rate, max(min_rate, rate or min_rate))
+    self.low = low
+    self.high = high
+    self.stall_time = stall_time
+    self.verbose = verbose
+    self.replies = b''
+    self.eof = False              # the device closed the connection
+    self.acks = 0                 # number of ffff replies
+    self.bytes = 0
+    self.backoffs = 0
+    self.stalls = 0
+    self.stalling = False
+    self.peak = self.rate
+    self.t_start = self.next_t = self.drained_t = self.backoff_t = time.monotonic()
+
+  def delay(self):
+    """ Seconds to wait before the next packet may go out. """
+    now = time.monotonic()
+    if now - self.next_t > self.max_burst:
+      self.next_t = now
+    return max(0., self.next_t - now)
+
+  def send(self, msg):
+    time.sleep(self.delay())
+    t0 = time.monotonic()
+    self.s.sendall(msg)
+    blocked = time.monotonic() - t0
+    self.poll_replies()
+    self.sent(len(msg), blocked)
+
+  def sent(self, n, blocked):
+    """ Account for n bytes that went out, after blocked seconds waiting for the socket. """
+    self.bytes += n
+    self.next_t += n / self.rate
+    self.adjust(blocked)
+
+  def adjust(self, blocked):
+    now = time.monotonic()
+    q = send_queue(self.s)
+    if q is None:
+      congested = blocked > self.block_time
+      idle = not congested
+    else:
+      congested = q > self.high
+      idle = q < self.low
+    if not congested:
+      self.drained_t = now
+      if idle:
+        self.rate = min(self.max_rate, self.rate * self.grow)
+        self.peak = max(self.peak, self.rate)
+    elif self.stalling:
+      pass
+    elif now - self.drained_t > self.stall_time:
+      self.stall(now - self.drained_t)
+    elif now - self.backoff_t > self.backoff_interval:
+      self.backoff(self.shrink, "send queue %s bytes" % q)
+
+  def backoff(self, factor, why):
+    self.backoffs += 1
+    self.backoff_t = time.monotonic()
+    self.rate = max(self.min_rate, self.rate * factor)
+    if self.verbose:
+      print("\nbackoff: %s, rate %.1f KB/s" % (why, self.rate / 1e3))
+
+  def stall(self, secs):
+    """
+       Back to the floor rate, wait for the queue to drain, but not until the device gives up.
+       With blocking = False we return at once, the caller polls drained() instead.
+    """
+    self.stalls += 1
+    self.stalling = True
+    self.rate = self.min_rate
+    if self.verbose:
+      print("\nupload stalled for %.1f sec, waiting for the device ..." % secs)
+    while self.blocking and not self.drained():
+      self.poll_replies()
+      time.sleep(0.05)
+
+  def drained(self):
+    """ True when the queue is short again after a stall. TimeoutError if we waited too long. """
+    q = send_queue(self.s)
+    waited = time.monotonic() - self.drained_t
+    if q is None or q <= self.low:
+      self.stalling = False
+      self.drained_t = self.backoff_t = self.next_t = time.monotonic()
+      return True
+    if waited > device_timeout:
+      raise TimeoutError("upload stalled for %.1f sec, %d bytes still queued. The device will play the partial file." % (waited, q))
+    return False
+
+  def wait_reply(self, timeout):
+    """ Wait up to timeout seconds for the next reply, return it or None. """
+    end = time.monotonic() + timeout
+    while True:
+      replies = self.poll_replies()
+      if replies:
+        return replies[0]
+      if self.eof:
+        return None
+      left = end - time.monotonic()
+      if left <= 0 or not select.select([self.s], [], [], left)[0]:
+        return None
+
+  def poll_replies(self):
+    """ Read what the device sent without blocking, return the new replies, e.g. b'1AfJffff'. """
+    replies = []
+    while not self.eof and select.select([self.s], [], [], 0)[0]:
+      buf = self.s.recv(1024)
+      if not buf:
+        self.eof = True
+        break
+      replies += self.feed(buf)
+    return replies
+
+  def feed(self, buf):
+    """ Bytes received from the device, returns the replies completed by them. """
+    if self.verbose:
+      print("\nreceived %s" % buf)
+    self.replies += buf
+    replies = []
+    while True:
+      i = self.replies.find(b'AfJ')
+      if i < 1 or len(self.replies) < i+7:
+        break
+      replies.append(self.replies[i-1:i+7])
+      self.replies = self.replies[i+7:]
+    self.replies = self.replies[-7:]    # keep a partial reply
+    for reply in replies:
+      if reply[4:] == b'ffff':
+        self.acks += 1
+      else:
+        self.backoff(0.5, "reply %s" % reply.decode('latin-1'))
+    return replies
+
+  def stats(self):
+    secs = max(1e-6, time.monotonic() - self.t_start)
+    return "%d bytes in %.1f sec, %.1f KB/s, peak rate %.1f KB/s, %d acks, %d backoffs, %d stalls" % (
+      self.bytes, secs, self.bytes / secs / 1e3, self.peak / 1e3, self.acks, self.backoffs, self.stalls)
@@ -0,0 +1,151 @@
+#! /usr/bin/python3
+#
+# video_source.py -- frames from animations and videos, at the frame rate of the device.
+#
+# Animated GIF, APNG and WebP are decoded by PIL, one frame at a time (ImageSequence).
+# Videos (.mp4, .mov, .mkv, .webm, .avi) are decoded by ffmpeg into a rawvideo pipe, one
+# RGB frame per read(). No frame goes to disk.
+#
+# The device plays bin_file.fps frames per second, about 9.35. Device frame k is shown
+# at k/fps and gets the source frame that is on screen at that time. A source frame
+# from t0 to t1 thus covers ceil(t1*fps) - ceil(t0*fps) device frames: with 0 it is
+# dropped, with more than 1 it is repeated. Repeats are not encoded again, the
+# encoder writes the same block repeat times. For videos the fps filter of ffmpeg does
+# the resampling, consecutive equal frames are merged into one with a repeat count.
+#
+# Video frames are cropped to a centered square, the encoder uses the largest circle
+# around the center of a square image.
+#
+
+import math, subprocess
+from PIL import Image, ImageSequence
+
+ffmpeg_suffixes = ('.mp4', '.m4v', '.mov', '.mkv', '.webm', '.avi', '.mpg', '.mpeg')
+default_duration = 100          # ms, browsers do the same for GIF frames without a delay
+
+
+class VideoFrame(str):
+  """
+     The name of a video frame, e.g. 'clip.gif@12', that also brings its decoded
+     image (square, RGB) and repeat, the number of device frames it is shown.
+     Can be used wherever a file name of a still image is expected.
+  """
+  def __new__(cls, name, image=None, repeat=1):
+    self = str.__new__(cls, name)
+    self.image = image
+    self.repeat = repeat
+    return self
+
+
+def square(im):
+  """ The centered square of im, in RGB """
+  w, h = im.size
+  d = min(w, h)
+  if w != h:
+    im = im.crop(((w - d) // 2, (h - d) // 2, (w - d) // 2 + d, (h - d) // 2 + d))
+  return im.convert('RGB')
+
+
+def is_video(path):
+  """ True for a file that frames() should decode, False for a still image """
+  if path.lower().endswith(ffmpeg_suffixes):
+    return True
+  try:
+    with Image.open(path) as im:
+      return getattr(im, 'is_animated', False)
+  except OSError:
+    return False
+
+
+def ticks(durations, fps):
+  """ Generator, the number of device frames for each of the source frame durations in ms """
+  t = done = 0
+  for d in durations:
+    t += d / 1000.
+    n = math.ceil(t * fps - 1e-9) - done
+    done += n
+    yield n
+
+
+def pil_frames(path, fps):
+  with Image.open(path) as im:
+    frames = ImageSequence.Iterator(im)
+    durations = (f.info.get('duration') or default_duration for f in frames)
+    # durations and frames advance together, each duration is read from the frame in hand.
+    for i, n in enumerate(ticks(durations, fps)):
+      if n > 0:
+        yield VideoFrame('%s@%d' % (path, i), square(im), n)
+
+
+def probe(path):
+  """ (width, height, seconds) of the first video stream, via ffprobe """
+  try:
+    out = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries',
+                          'stream=width,height:format=duration', '-of', 'default=noprint_wrappers=1', path],
+                         check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+  except FileNotFoundError:
+    raise OSError("ffprobe not found. %s needs ffmpeg, see https://ffmpeg.org" % path)
+  except subprocess.CalledProcessError:
+    raise ValueError("%s: not a video" % path)
+  info = dict(line.split('=', 1) for line in out.split() if '=' in line)
+  try:
+    return int(info['width']), int(info['height']), float(info.get('duration', 0))
+  except (KeyError, ValueError):
+    raise ValueError("%s: no video stream" % path)
+
+
+def ffmpeg_frames(path, fps):
+  w, h, secs = probe(path)
+  cmd = ['ffmpeg', '-v', 'error', '-i', path, '-vf', 'fps=%.6f' % fps, '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-']
+  try:
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=w*h*3)
+  except FileNotFoundError:
+    raise OSError("ffmpeg not found. %s needs it, see https://ffmpeg.org" % path)
+  prev, i, n = None, 0, 0
+  try:
+    while True:
+      buf = p.stdout.read(w*h*3)
+      if len(buf) < w*h*3:
+        break
+      if buf == prev:
+        n += 1
+        continue
+      if prev is not None:
+        yield VideoFrame('%s@%d' % (path, i), square(Image.frombytes('RGB', (w, h), prev)), n)
+      prev, i, n = buf, i + n, 1
+    if prev is not None:
+      yield VideoFrame('%s@%d' % (path, i), square(Image.frombytes('RGB', (w, h), prev)), n)
+  finally:
+    p.stdout.close()
+    if p.poll() is None:
+      p.kill()                  # stopped early by the consumer
+    p.wait()
+  if p.returncode not in (0, -9):
+    raise ValueError("%s: ffmpeg failed with exit code %d" % (path, p.returncode))
+
+
+def frames(path, fps):
+  """ Generator of VideoFrames for an animation or video. The repeats add up to its duration at fps. """
+  if path.lower().endswith(ffmpeg_suffixes):
+    return ffmpeg_frames(path, fps)
+  return pil_frames(path, fps)
+
+
+def frame_count(path, fps):
+  """
+     Device frames for an animation or video. Exact for PIL formats, from the duration
+     for ffmpeg formats, the actual count can be off by one or two there.
+  """
+  if path.lower().endswith(ffmpeg_suffixes):
+    return max(1, round(probe(path)[2] * fps))
+  with Image.open(path) as im:
+    return sum(ticks((f.info.get('duration') or default_duration for f in ImageSequence.Iterator(im)), fps))
+
+
+def expand(paths, fps):
+  """ Generator, the still images of paths as they are, animations and videos as VideoFrames. """
+  for path in paths:
+    if is_video(path):
+      yield from frames(path, fps)
+    else:
+      yield path
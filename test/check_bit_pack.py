@@ -0,0 +1,43 @@
+#! /usr/bin/python3
+#
+# check_bit_pack.py -- compare bit_pack.pack_frame() with the old per bit OR loop
+#
+# All .bin files in bin/ are split into 42 byte rows after the 4096 byte header, unpacked
+# into (ray, led, color) bits and packed again. The first 2700 rows also go through the
+# loop that encode_polar_bin() used before v0.5. Everything must come out byte for byte.
+#
+# Usage: cd test; python3 check_bit_pack.py [file.bin ...]
+
+import sys, glob
+sys.path.insert(0, '../src')
+from bit_pack import rgb_bit_columns, pack_frame, unpack_frame
+
+leds = 224
+row = 3*leds//16
+
+def loop_pack(bits):
+  po_width = leds // 2 * 3
+  out = []
+  for n in range(len(bits)):
+    out.append([0] * row)
+  for led in range(leds//2):
+    cols = rgb_bit_columns(led, po_width)
+    for c in range(3):
+      column = cols[c]
+      byte   =       column // 8
+      bitval = 1 << (column % 8)
+      for n in range(len(bits)):
+        if bits[n][led][c]:
+          out[n][byte] |= bitval;
+  return bytes(b for r in out for b in r)
+
+failed = 0
+for f in sys.argv[1:] or sorted(glob.glob('bin/*.bin')):
+  data = open(f, 'rb').read()[0x1000:]
+  data = data[:len(data)//row*row]
+  bits = unpack_frame(data, leds)
+  ok = pack_frame(bits).tobytes() == data
+  ok = ok and loop_pack(bits[:2700].tolist()) == data[:2700*row]
+  print("%-40s %6d rows  %s" % (f, len(data)//row, "ok" if ok else "MISMATCH"))
+  if not ok: failed += 1
+sys.exit(failed)
@@ -0,0 +1,45 @@
+#! /usr/bin/python3
+#
+# check_polar_sample.py -- compare polar_sample.PolarSampler with the old per sample loop
+#
+# All images in png/ and the first frame of each gif/ are resampled into n_rays x leds//2
+# RGB samples twice: with PolarSampler.resample() and with the polar2cart() + quad_avg()
+# loop that encode_polar_bin() used before v0.5. Everything must come out byte for byte.
+# resample_samples() must give the same values for a random subset of the samples.
+#
+# Usage: cd test; python3 check_polar_sample.py [image ...]
+
+import sys, glob, math
+sys.path.insert(0, '../src')
+import numpy as np
+from PIL import Image
+from encode_polar_bin import quad_avg, polar2cart, n_rays, leds
+from polar_sample import PolarSampler
+
+
+def loop_resample(im, diam, c_x, c_y):
+  pix = im.load()
+  sca = float(diam-1)/float(leds-1)
+  out = []
+  for n in range(n_rays):
+    phi = math.radians(360.*(n_rays-n)/n_rays)
+    for led in range(leds//2):
+      (x,y) = polar2cart(c_x, c_y, (0.5+led) * sca, phi)
+      out.append(quad_avg(pix, x, y))
+  return np.array(out, dtype=np.uint8).reshape(n_rays, leds//2, -1)
+
+
+failed = 0
+rnd = np.random.RandomState(0)
+for f in sys.argv[1:] or sorted(glob.glob('png/*.png')) + sorted(glob.glob('gif/*.gif')):
+  im = Image.open(f).convert('RGB')
+  diam = min(im.width, im.height)
+  c = (diam-1.)/2
+  sampler = PolarSampler(diam, c, c, n_rays, leds)
+  rgb = sampler.resample(im)
+  ok = np.array_equal(rgb, loop_resample(im, diam, c, c))
+  samples = np.sort(rnd.choice(n_rays * (leds//2), 5000, replace=False))
+  ok = ok and np.array_equal(sampler.resample_samples(im, samples), rgb.reshape(-1, 3)[samples])
+  print("%-40s %4d px  %s" % (f, diam, "ok" if ok else "MISMATCH"))
+  if not ok: failed += 1
+sys.exit(failed)